@@ -0,0 +1,252 @@
+"""
+Локальная имитация эндпоинтов Avito, которые использует src/services/avito_api.py.
+Задержка, доля ошибок 5xx и доля ответов 429 настраиваются.
+"""
+import asyncio
+import random
+import time
+from collections import Counter
+from aiohttp import web
+
+
+class FakeAvito:
+    def __init__(self, latency: float = 0.0, latency_jitter: float = 0.0, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, retry_after: float = 0.1, seed: int = 0):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.requests = Counter()  # эндпоинт -> число запросов
+        self.statuses = Counter()
+        self.chats = {}  # account_id -> {chat_id: {"chat": ..., "messages": [...]}}
+        self._message_seq = 0
+        self.runner = None
+        self.base_url = None
+
+    # --- данные ---
+
+    def _next_message_id(self) -> str:
+        self._message_seq += 1
+        return f"m{self._message_seq}"
+
+    def seed(self, accounts: int, chats_per_account: int, unread_per_chat: int = 1, images_per_chat: int = 0):
+        """Создает аккаунты 1..accounts, в каждом chats_per_account чатов с непрочитанными сообщениями."""
+        for account_id in range(1, accounts + 1):
+            account_chats = self.chats.setdefault(str(account_id), {})
+            for n in range(chats_per_account):
+                chat_id = f"u2i-{account_id}-{n}"
+                buyer_id = 1_000_000 + account_id * 1000 + n
+                account_chats[chat_id] = {
+                    "chat": {
+                        "id": chat_id,
+                        "users": [
+                            {
+                                "id": buyer_id,
+                                "name": f"Покупатель {n}",
+                                "public_user_profile": {"url": f"https://www.avito.ru/user/{buyer_id}/profile"},
+                            },
+                            {
+                                "id": account_id,
+                                "name": f"Продавец {account_id}",
+                                "public_user_profile": {"url": f"https://www.avito.ru/user/{account_id}/profile"},
+                            },
+                        ],
+                        "context": {
+                            "type": "item",
+                            "value": {
+                                "id": account_id * 1000 + n,
+                                "title": f"Объявление {n}",
+                                "url": f"https://www.avito.ru/item/{account_id * 1000 + n}",
+                            },
+                        },
+                        "last_message": None,
+                    },
+                    "messages": [],
+                }
+                for _ in range(unread_per_chat):
+                    self.add_incoming(str(account_id), chat_id, f"Здравствуйте! Вопрос {n}")
+                for _ in range(images_per_chat):
+                    self.add_incoming_image(str(account_id), chat_id)
+
+    def add_incoming(self, account_id: str, chat_id: str, text: str):
+        entry = self.chats[account_id][chat_id]
+        buyer_id = entry["chat"]["users"][0]["id"]
+        message = {
+            "id": self._next_message_id(),
+            "author_id": buyer_id,
+            "created": int(time.time()),
+            "content": {"text": text},
+            "type": "text",
+            "direction": "in",
+            "isRead": False,
+        }
+        entry["messages"].append(message)
+        entry["chat"]["last_message"] = {"id": message["id"], "created": message["created"]}
+        return message
+
+    def add_incoming_image(self, account_id: str, chat_id: str, name: str = "photo.jpg"):
+        """Входящее фото; все фото указывают на один файл, что проверяет кэш file_id."""
+        message = self.add_incoming(account_id, chat_id, "")
+        message["type"] = "image"
+        message["content"] = {"image": {"sizes": {
+            "140x105": f"{self.base_url}/media/small-{name}",
+            "1280x960": f"{self.base_url}/media/{name}",
+        }}}
+        return message
+
+    # --- поведение ---
+
+    async def _simulate(self, endpoint: str):
+        self.requests[endpoint] += 1
+        delay = self.latency + self.random.uniform(0, self.latency_jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.rate_limit_rate and self.random.random() < self.rate_limit_rate:
+            self.statuses[429] += 1
+            return web.json_response(
+                {"error": "too many requests"}, status=429, headers={"Retry-After": str(self.retry_after)}
+            )
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.statuses[500] += 1
+            return web.json_response({"error": "internal error"}, status=500)
+        return None
+
+    def _ok(self, data):
+        self.statuses[200] += 1
+        return web.json_response(data)
+
+    @staticmethod
+    def _account_from_token(request: web.Request) -> str:
+        # Токен выдается как "token-<account_id>"
+        auth = request.headers.get("Authorization", "")
+        return auth.rsplit("token-", 1)[-1]
+
+    async def token(self, request: web.Request):
+        failure = await self._simulate("token")
+        if failure:
+            return failure
+        data = await request.post()
+        client_id = data.get("client_id", "")
+        # client_id вида "client-<account_id>"
+        account_id = client_id.rsplit("-", 1)[-1]
+        return self._ok({"access_token": f"token-{account_id}", "expires_in": 86400, "token_type": "Bearer"})
+
+    async def self_info(self, request: web.Request):
+        failure = await self._simulate("accounts_self")
+        if failure:
+            return failure
+        account_id = self._account_from_token(request)
+        return self._ok({"id": int(account_id), "name": f"Продавец {account_id}"})
+
+    async def account_info(self, request: web.Request):
+        failure = await self._simulate("account_info")
+        if failure:
+            return failure
+        account_id = request.match_info["user_id"]
+        return self._ok({"id": int(account_id), "name": f"Пользователь {account_id}"})
+
+    async def chats_list(self, request: web.Request):
+        failure = await self._simulate("chats")
+        if failure:
+            return failure
+        account_chats = self.chats.get(request.match_info["user_id"], {})
+        unread_only = request.query.get("unread_only") == "true"
+        limit = int(request.query.get("limit", 100))
+        offset = int(request.query.get("offset", 0))
+        chats = [
+            entry["chat"] for entry in account_chats.values()
+            if not unread_only or any(not m["isRead"] and m["direction"] == "in" for m in entry["messages"])
+        ]
+        return self._ok({"chats": chats[offset:offset + limit]})
+
+    async def chat_messages(self, request: web.Request):
+        failure = await self._simulate("messages")
+        if failure:
+            return failure
+        entry = self.chats.get(request.match_info["user_id"], {}).get(request.match_info["chat_id"])
+        if entry is None:
+            return web.json_response({"error": "not found"}, status=404)
+        limit = int(request.query.get("limit", 100))
+        offset = int(request.query.get("offset", 0))
+        # Avito отдает сообщения от новых к старым
+        messages = list(reversed(entry["messages"]))[offset:offset + limit]
+        return self._ok({"messages": messages})
+
+    async def chat_read(self, request: web.Request):
+        failure = await self._simulate("read")
+        if failure:
+            return failure
+        entry = self.chats.get(request.match_info["user_id"], {}).get(request.match_info["chat_id"])
+        if entry is not None:
+            for message in entry["messages"]:
+                message["isRead"] = True
+        return self._ok({"ok": True})
+
+    async def send(self, request: web.Request):
+        failure = await self._simulate("send")
+        if failure:
+            return failure
+        body = await request.json()
+        account_id = request.match_info["user_id"]
+        entry = self.chats.get(account_id, {}).get(request.match_info["chat_id"])
+        if entry is None:
+            return web.json_response({"error": "not found"}, status=404)
+        message = {
+            "id": self._next_message_id(),
+            "author_id": int(account_id),
+            "created": int(time.time()),
+            "content": {"text": body.get("message", {}).get("text")},
+            "type": "text",
+            "direction": "out",
+            "isRead": True,
+        }
+        entry["messages"].append(message)
+        entry["chat"]["last_message"] = {"id": message["id"], "created": message["created"]}
+        return self._ok(message)
+
+    async def media(self, request: web.Request):
+        self.requests["media"] += 1
+        # Отдаем файл частями, как CDN
+        response = web.StreamResponse(headers={"Content-Type": "image/jpeg"})
+        await response.prepare(request)
+        for _ in range(16):
+            await response.write(b"\xff" * 16 * 1024)
+        await response.write_eof()
+        return response
+
+    async def webhook(self, request: web.Request):
+        failure = await self._simulate("webhook")
+        if failure:
+            return failure
+        return self._ok({"ok": True})
+
+    # --- сервер ---
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/token/", self.token)
+        app.router.add_get("/core/v1/accounts/self", self.self_info)
+        app.router.add_get("/core/v1/accounts/{user_id}", self.account_info)
+        app.router.add_get("/messenger/v2/accounts/{user_id}/chats", self.chats_list)
+        app.router.add_get("/messenger/v3/accounts/{user_id}/chats/{chat_id}/messages/", self.chat_messages)
+        app.router.add_post("/messenger/v1/accounts/{user_id}/chats/{chat_id}/read", self.chat_read)
+        app.router.add_post("/messenger/v1/accounts/{user_id}/chats/{chat_id}/messages", self.send)
+        app.router.add_post("/messenger/v3/webhook", self.webhook)
+        app.router.add_get("/media/{name}", self.media)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self.runner = web.AppRunner(self.app())
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
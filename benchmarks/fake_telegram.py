@@ -0,0 +1,74 @@
+"""
+Локальная имитация Telegram Bot API, на которую можно направить aiogram.Bot:
+
+    bot = Bot(token=..., session=AiohttpSession(api=TelegramAPIServer.from_base(fake.base_url)))
+"""
+import asyncio
+import time
+from collections import Counter
+from aiohttp import web
+
+
+class FakeTelegram:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = Counter()  # метод -> число вызовов
+        self.sent = []  # (chat_id, message_id, text, время отправки)
+        self._message_seq = 0
+        self.runner = None
+        self.base_url = None
+
+    def _message(self, chat_id, text):
+        self._message_seq += 1
+        return {
+            "message_id": self._message_seq,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "text": text,
+        }
+
+    async def handle(self, request: web.Request):
+        method = request.match_info["method"]
+        self.requests[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if request.content_type == "application/json":
+            data = await request.json()
+        else:
+            data = dict(await request.post())
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        elif method in ("sendMessage", "sendPhoto", "sendDocument", "sendVoice"):
+            result = self._message(data.get("chat_id", 0), data.get("text") or data.get("caption"))
+            self.sent.append((result["chat"]["id"], result["message_id"], result["text"], time.monotonic()))
+            # Загруженному файлу выдается file_id; повторная отправка приходит строкой с этим id
+            if method == "sendPhoto":
+                result["photo"] = [{"file_id": f"photo-{result['message_id']}", "file_unique_id": "p", "width": 1, "height": 1}]
+            elif method == "sendDocument":
+                result["document"] = {"file_id": f"doc-{result['message_id']}", "file_unique_id": "d"}
+        elif method == "editMessageText":
+            result = self._message(data.get("chat_id", 0), data.get("text"))
+            result["message_id"] = int(data.get("message_id", 0))
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self.runner = web.AppRunner(self.app())
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        host, port = self.runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
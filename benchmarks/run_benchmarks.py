@@ -0,0 +1,207 @@
+"""
+Офлайн-бенчмарки путей опроса и ответа на локальных имитациях Avito и Telegram.
+
+Пример:
+    python benchmarks/run_benchmarks.py --users 50 --chats 20 --replies 100 --output bench.json
+
+Результаты пишутся в JSON вместе с хэшем коммита, чтобы сравнивать прогоны между коммитами.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарки бота Avito")
+    parser.add_argument("--users", type=int, default=20, help="Количество аккаунтов (N)")
+    parser.add_argument("--chats", type=int, default=10, help="Чатов с непрочитанными сообщениями на аккаунт (M)")
+    parser.add_argument("--unread", type=int, default=1, help="Непрочитанных сообщений в каждом чате (пачка для дайджеста)")
+    parser.add_argument("--images", type=int, default=0, help="Входящих фото в каждом чате")
+    parser.add_argument("--replies", type=int, default=50, help="Количество ответов для замера round-trip")
+    parser.add_argument("--avito-latency", type=float, default=0.02, help="Задержка ответа Avito, с")
+    parser.add_argument("--avito-jitter", type=float, default=0.01)
+    parser.add_argument("--avito-error-rate", type=float, default=0.0)
+    parser.add_argument("--avito-429-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-latency", type=float, default=0.01)
+    parser.add_argument("--output", default="bench_output.json")
+    return parser.parse_args()
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {
+        "count": len(ordered),
+        "mean": statistics.fmean(ordered),
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "max": ordered[-1],
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+async def run(args, workdir):
+    from fake_avito import FakeAvito
+    from fake_telegram import FakeTelegram
+
+    fake_avito = FakeAvito(
+        latency=args.avito_latency,
+        latency_jitter=args.avito_jitter,
+        error_rate=args.avito_error_rate,
+        rate_limit_rate=args.avito_429_rate,
+    )
+    fake_telegram = FakeTelegram(latency=args.telegram_latency)
+    avito_url = await fake_avito.start()
+    telegram_url = await fake_telegram.start()
+
+    # Настройки читаются при импорте config, поэтому задаем их до импорта модулей бота
+    db_path = os.path.join(workdir, "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    os.environ["AVITO_API_URL"] = avito_url
+    os.environ.setdefault("TELEGRAM_CHAT_RPS", "0")
+    os.environ.setdefault("TELEGRAM_GLOBAL_RPS", "0")
+
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from sqlalchemy import func, select
+    from src.database.db import async_session, engine, init_db
+    from src.models import User, MessageLink, OutboxMessage, ForwardedMessage, MediaFile, Chat, Participant
+    from src.services.avito_api import avito_client
+    from src.services.message_service import run_poll_cycle, send_message_to_avito
+    from src.services.outbox_service import outbox
+
+    await init_db()
+    await avito_client.start()
+    bot = Bot(
+        token="123456:BENCHMARK",
+        session=AiohttpSession(api=TelegramAPIServer.from_base(telegram_url)),
+    )
+
+    results = {"params": vars(args).copy(), "revision": git_revision()}
+
+    # Сид: N аккаунтов по M чатов
+    fake_avito.seed(args.users, args.chats, args.unread, args.images)
+    async with async_session() as session:
+        for account_id in range(1, args.users + 1):
+            session.add(User(
+                user_id=account_id,
+                client_id=f"client-{account_id}",
+                client_secret="secret",
+                telegram_chat_id=10_000 + account_id,
+                avito_user_id=str(account_id),
+            ))
+        await session.commit()
+
+    async def measure_cycle(name):
+        requests_before = dict(fake_avito.requests)
+        sent_before = len(fake_telegram.sent)
+        stats = await run_poll_cycle(bot)
+        requests = {
+            endpoint: count - requests_before.get(endpoint, 0)
+            for endpoint, count in fake_avito.requests.items()
+            if count - requests_before.get(endpoint, 0)
+        }
+        results[name] = {
+            **stats,
+            "avito_requests": requests,
+            "avito_requests_total": sum(requests.values()),
+            "telegram_messages": len(fake_telegram.sent) - sent_before,
+        }
+
+    # Первый цикл: все чаты с новыми сообщениями
+    await measure_cycle("poll_cycle_cold")
+    # Второй цикл: ничего не изменилось — установившийся режим
+    await measure_cycle("poll_cycle_steady")
+
+    # Round-trip ответа: прямой вызов send_message_to_avito
+    async with async_session() as session:
+        links = await session.execute(
+            select(MessageLink.telegram_chat_id, MessageLink.telegram_message_id).limit(args.replies)
+        )
+        link_ids = links.all()
+
+    latencies = []
+    for telegram_chat_id, telegram_message_id in link_ids:
+        started = time.monotonic()
+        await send_message_to_avito(telegram_chat_id, telegram_message_id, "Да, актуально")
+        latencies.append(time.monotonic() - started)
+    results["reply_direct"] = percentiles(latencies)
+
+    # Round-trip через outbox: от постановки в очередь до доставки всех ответов
+    await outbox.start(bot)
+    started = time.monotonic()
+    for n, (telegram_chat_id, telegram_message_id) in enumerate(link_ids):
+        await outbox.enqueue(
+            telegram_chat_id=telegram_chat_id,
+            telegram_message_id=1_000_000 + n,
+            reply_to_message_id=telegram_message_id,
+            text=f"Ответ через outbox {n}",
+        )
+    enqueue_time = time.monotonic() - started
+    while True:
+        async with async_session() as session:
+            pending = await session.execute(
+                select(func.count(OutboxMessage.id)).where(OutboxMessage.status.in_(["pending", "sending"]))
+            )
+            if not pending.scalar():
+                break
+        await asyncio.sleep(0.01)
+    drain_time = time.monotonic() - started
+    await outbox.stop()
+    results["reply_outbox"] = {
+        "count": len(link_ids),
+        "enqueue_total": enqueue_time,
+        "drain_total": drain_time,
+        "per_reply": drain_time / len(link_ids) if link_ids else None,
+    }
+
+    # Рост базы
+    async with async_session() as session:
+        counts = {}
+        for model in (User, MessageLink, ForwardedMessage, MediaFile, Chat, Participant, OutboxMessage):
+            count = await session.execute(select(func.count()).select_from(model))
+            counts[model.__tablename__] = count.scalar()
+    size = sum(
+        os.path.getsize(path) for path in (db_path, db_path + "-wal", db_path + "-shm") if os.path.exists(path)
+    )
+    results["database"] = {"rows": counts, "size_bytes": size}
+    results["avito_statuses"] = dict(fake_avito.statuses)
+
+    await bot.session.close()
+    await avito_client.close()
+    await engine.dispose()
+    await fake_avito.stop()
+    await fake_telegram.stop()
+    return results
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        results = asyncio.run(run(args, workdir))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
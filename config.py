@@ -3,4 +3,134 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
\ No newline at end of file
+TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+
+# Логирование
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_LEVELS = os.getenv('LOG_LEVELS', 'aiogram.event=WARNING,aiohttp.access=WARNING,apscheduler=WARNING')  # Уровни по модулям: имя=УРОВЕНЬ через запятую
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # text или json
+LOG_FILE = os.getenv('LOG_FILE', '')  # Пусто — только stdout
+LOG_FILE_MAX_BYTES = int(os.getenv('LOG_FILE_MAX_BYTES', str(50 * 1024 * 1024)))
+LOG_FILE_BACKUPS = int(os.getenv('LOG_FILE_BACKUPS', '5'))
+LOG_THROTTLE = float(os.getenv('LOG_THROTTLE', '60'))  # Не чаще раза в столько секунд для повторяющихся строк цикла опроса
+
+# Настройки HTTP-клиента Avito
+AVITO_API_URL = os.getenv('AVITO_API_URL', 'https://api.avito.ru')
+AVITO_HTTP_LIMIT = int(os.getenv('AVITO_HTTP_LIMIT', '100'))
+AVITO_HTTP_LIMIT_PER_HOST = int(os.getenv('AVITO_HTTP_LIMIT_PER_HOST', '50'))
+AVITO_HTTP_DNS_TTL = int(os.getenv('AVITO_HTTP_DNS_TTL', '300'))
+AVITO_HTTP_KEEPALIVE = float(os.getenv('AVITO_HTTP_KEEPALIVE', '30'))
+AVITO_HTTP_TIMEOUT = float(os.getenv('AVITO_HTTP_TIMEOUT', '30'))
+AVITO_HTTP_CONNECT_TIMEOUT = float(os.getenv('AVITO_HTTP_CONNECT_TIMEOUT', '10'))
+AVITO_PAGE_SIZE = int(os.getenv('AVITO_PAGE_SIZE', '100'))  # limit для постраничных списков чатов и сообщений
+AVITO_MAX_PAGES = int(os.getenv('AVITO_MAX_PAGES', '100'))  # Предел страниц за один обход списка
+
+# Опрос сообщений
+POLL_CONCURRENCY = int(os.getenv('POLL_CONCURRENCY', '20'))
+CHAT_FETCH_CONCURRENCY = int(os.getenv('CHAT_FETCH_CONCURRENCY', '8'))  # Чатов одного аккаунта, читаемых одновременно
+POLL_INTERVAL = float(os.getenv('POLL_INTERVAL', '1'))  # Интервал для аккаунта с активными чатами
+POLL_MAX_INTERVAL = float(os.getenv('POLL_MAX_INTERVAL', '30'))  # Предел для простаивающего аккаунта
+POLL_IDLE_GROWTH = float(os.getenv('POLL_IDLE_GROWTH', '1.5'))
+POLL_ERROR_MAX_INTERVAL = float(os.getenv('POLL_ERROR_MAX_INTERVAL', '600'))
+POLL_JITTER = float(os.getenv('POLL_JITTER', '0.2'))  # Доля случайного разброса интервала
+POLL_USERS_REFRESH = float(os.getenv('POLL_USERS_REFRESH', '30'))  # Как часто перечитывать список аккаунтов
+
+# Прием событий мессенджера Avito через вебхук
+WEBHOOK_ENABLED = os.getenv('WEBHOOK_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_PUBLIC_URL = os.getenv('WEBHOOK_PUBLIC_URL', '')  # Внешний адрес, на который Avito шлет события
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '10000'))
+WEBHOOK_SAFETY_POLL_INTERVAL = float(os.getenv('WEBHOOK_SAFETY_POLL_INTERVAL', '60'))
+
+# Токены доступа Avito
+TOKEN_RENEW_AHEAD = float(os.getenv('TOKEN_RENEW_AHEAD', '300'))  # За сколько секунд до истечения обновлять токен
+TOKEN_RENEW_CHECK = float(os.getenv('TOKEN_RENEW_CHECK', '30'))
+
+# Ограничение частоты запросов (запросов в секунду; 0 — без ограничения)
+AVITO_GLOBAL_RPS = float(os.getenv('AVITO_GLOBAL_RPS', '50'))
+AVITO_ACCOUNT_RPS = float(os.getenv('AVITO_ACCOUNT_RPS', '5'))
+AVITO_MAX_RETRIES = int(os.getenv('AVITO_MAX_RETRIES', '3'))  # Повторы после ответа 429
+# Минимальные доли лимита Avito для фоновых запросов, чтобы ответы не вытесняли их полностью
+AVITO_FETCH_MIN_SHARE = float(os.getenv('AVITO_FETCH_MIN_SHARE', '0.2'))  # Чтение чатов и сообщений
+AVITO_HOUSEKEEPING_MIN_SHARE = float(os.getenv('AVITO_HOUSEKEEPING_MIN_SHARE', '0.1'))  # Отметки о прочтении и прочее
+TELEGRAM_GLOBAL_RPS = float(os.getenv('TELEGRAM_GLOBAL_RPS', '30'))
+TELEGRAM_CHAT_RPS = float(os.getenv('TELEGRAM_CHAT_RPS', '1'))
+TELEGRAM_MAX_RETRIES = int(os.getenv('TELEGRAM_MAX_RETRIES', '3'))
+
+# Карантин аккаунтов при сбоях API Avito (circuit breaker по аккаунту и классу запросов)
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))  # Ошибок подряд до размыкания; отказ в токене — сразу
+CIRCUIT_OPEN_DELAY = float(os.getenv('CIRCUIT_OPEN_DELAY', '30'))  # Первая пауза, дальше удваивается
+CIRCUIT_MAX_OPEN_DELAY = float(os.getenv('CIRCUIT_MAX_OPEN_DELAY', '3600'))
+
+# База данных
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite+aiosqlite:///./database.db')
+DB_ECHO = os.getenv('DB_ECHO', 'false').lower() in ('1', 'true', 'yes')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+DB_QUERY_CACHE_SIZE = int(os.getenv('DB_QUERY_CACHE_SIZE', '500'))  # Кэш скомпилированных SQL-выражений
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', '65536'))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+PG_STATEMENT_CACHE_SIZE = int(os.getenv('PG_STATEMENT_CACHE_SIZE', '500'))  # Подготовленные выражения asyncpg
+
+# Очистка message_links
+RETENTION_MAX_AGE_DAYS = int(os.getenv('RETENTION_MAX_AGE_DAYS', '30'))
+RETENTION_MAX_LINKS_PER_USER = int(os.getenv('RETENTION_MAX_LINKS_PER_USER', '5000'))
+RETENTION_CHUNK_SIZE = int(os.getenv('RETENTION_CHUNK_SIZE', '1000'))
+# Возврат освободившихся страниц SQLite: новая база создается с auto_vacuum=INCREMENTAL,
+# существующую нужно один раз перестроить: sqlite3 database.db "PRAGMA auto_vacuum=INCREMENTAL; VACUUM;"
+RETENTION_INCREMENTAL_VACUUM = os.getenv('RETENTION_INCREMENTAL_VACUUM', 'false').lower() in ('1', 'true', 'yes')
+RETENTION_VACUUM_PAGES = int(os.getenv('RETENTION_VACUUM_PAGES', '1000'))
+
+# Кэш маршрутов ответов ((чат Telegram, message_id) -> чат Avito)
+ROUTING_CACHE_SIZE = int(os.getenv('ROUTING_CACHE_SIZE', '50000'))
+ROUTING_CACHE_TTL = float(os.getenv('ROUTING_CACHE_TTL', '86400'))
+
+# Пересылка сообщений в Telegram
+FORWARD_SEEN_CACHE_SIZE = int(os.getenv('FORWARD_SEEN_CACHE_SIZE', '100000'))  # Недавно пересланные id сообщений в памяти
+DIGEST_MAX_MESSAGES = int(os.getenv('DIGEST_MAX_MESSAGES', '20'))  # Сообщений одного чата в одном дайджесте
+DIGEST_MAX_LENGTH = int(os.getenv('DIGEST_MAX_LENGTH', '3500'))  # Предел длины дайджеста (лимит Telegram — 4096)
+
+# Пересылка вложений (фото, голосовые, файлы)
+MEDIA_ENABLED = os.getenv('MEDIA_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+MEDIA_MAX_BYTES = int(os.getenv('MEDIA_MAX_BYTES', str(20 * 1024 * 1024)))  # Больше — отправляется ссылкой
+MEDIA_CONCURRENCY = int(os.getenv('MEDIA_CONCURRENCY', '4'))  # Одновременных скачиваний и загрузок
+MEDIA_CHUNK_SIZE = int(os.getenv('MEDIA_CHUNK_SIZE', str(64 * 1024)))
+MEDIA_TMP_DIR = os.getenv('MEDIA_TMP_DIR', '') or None  # Пусто — системный каталог временных файлов
+
+# Кэш данных чатов и собеседников (имена, профили, объявления)
+CHAT_CACHE_SIZE = int(os.getenv('CHAT_CACHE_SIZE', '20000'))
+CHAT_CACHE_TTL = float(os.getenv('CHAT_CACHE_TTL', '3600'))
+
+# Очередь исходящих ответов в Avito
+OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', '4'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_BACKOFF_BASE = float(os.getenv('OUTBOX_BACKOFF_BASE', '2'))
+OUTBOX_BACKOFF_MAX = float(os.getenv('OUTBOX_BACKOFF_MAX', '300'))
+
+# Метрики в формате Prometheus
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))
+
+# Диагностика производительности (по умолчанию выключена)
+DIAGNOSTICS_ENABLED = os.getenv('DIAGNOSTICS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', '0.1'))  # Период замера задержки цикла событий
+LOOP_LAG_WARN = float(os.getenv('LOOP_LAG_WARN', '0.1'))  # Задержка, о которой пишется предупреждение
+SLOW_CALLBACK_THRESHOLD = float(os.getenv('SLOW_CALLBACK_THRESHOLD', '0.25'))  # Блокировка цикла, после которой логируется стек
+PROFILE_DIR = os.getenv('PROFILE_DIR', './profiles')
+PROFILE_POLLS = int(os.getenv('PROFILE_POLLS', '20'))  # Опросов аккаунтов в профиле по умолчанию
+PROFILE_HZ = float(os.getenv('PROFILE_HZ', '100'))  # Частота снятия стеков
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '300'))
+ADMIN_IDS = {int(value) for value in os.getenv('ADMIN_IDS', '').split(',') if value.strip()}  # Telegram ID администраторов
+
+# Распределение опроса между процессами
+BOT_ROLE = os.getenv('BOT_ROLE', 'all')  # all — все в одном процессе, router — только Telegram, poller — только опрос
+SHARDING_ENABLED = os.getenv('SHARDING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+WORKER_ID = os.getenv('WORKER_ID', '')  # По умолчанию hostname:pid
+LEASE_TTL = float(os.getenv('LEASE_TTL', '30'))
+LEASE_HEARTBEAT = float(os.getenv('LEASE_HEARTBEAT', '10'))
@@ -1,35 +1,116 @@
 import asyncio
 from aiogram import Bot, Dispatcher
-from config import TELEGRAM_BOT_TOKEN
+from config import TELEGRAM_BOT_TOKEN, WEBHOOK_ENABLED, WEBHOOK_SAFETY_POLL_INTERVAL, POLL_INTERVAL, POLL_MAX_INTERVAL, BOT_ROLE
+from src.services import metrics
+from src.services.logging_config import setup_logging, stop_logging
+from src.services.telegram_api import telegram_limiter
 import logging
-from src.services.message_service import periodic_message_check, start_scheduler
-from src.database.db import engine
+from src.services.retention_service import start_scheduler
+from src.services.poll_scheduler import PollScheduler
+from src.database.db import init_db
+from src.services.avito_api import avito_client
+from src.services.token_manager import token_manager
+from src.services.circuit_breaker import circuit_breakers
+from src.services.diagnostics import diagnostics
+from src.services.outbox_service import outbox
+from src.services.lease_service import lease_manager
+from src.services.webhook_service import start_webhook_server, webhook_config_errors, webhook_consumer
 from src.handlers.register import register_router
 from src.handlers.start import start_router
+from src.handlers.admin import admin_router
 from src.handlers.check_messages import check_router
-from src.models.base import Base
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 async def main():
+    if WEBHOOK_ENABLED:
+        errors = webhook_config_errors()
+        if errors:
+            # Без секрета и внешнего адреса Avito не сможет доставить ни одного события
+            logger.error("WEBHOOK_ENABLED включен, но вебхук настроен неверно: %s", "; ".join(errors))
+            raise SystemExit(1)
+
     bot = Bot(token=TELEGRAM_BOT_TOKEN)
     dp = Dispatcher(bot=bot)
 
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    await init_db()
 
+    dp.include_router(admin_router)
     dp.include_router(start_router)
     dp.include_router(register_router)
     dp.include_router(check_router)
 
-    # Запускаем периодическую проверку сообщений
-    asyncio.create_task(periodic_message_check(bot))
+    # Замер задержки цикла событий и профилирование по запросу (DIAGNOSTICS_ENABLED)
+    diagnostics.start()
+
+    # Общая HTTP-сессия Avito на все время работы процесса
+    await avito_client.start()
+    # Фоновое обновление токенов до истечения
+    token_manager.start()
+
+    # router принимает сообщения Telegram и доставляет ответы, poller опрашивает Avito
+    routes_telegram = BOT_ROLE in ("all", "router")
+    polls_accounts = BOT_ROLE in ("all", "poller")
+
+    webhook_runner = None
+    metrics_runner = None
+    try:
+        # Аренды аккаунтов и лидерства при нескольких процессах с общей базой
+        await lease_manager.start(polls_accounts=polls_accounts)
+
+        if metrics.enabled:
+            metrics.AVITO_LIMITER_QUEUE.set_function(avito_client.limiter.queue_depth)
+            metrics.TELEGRAM_LIMITER_QUEUE.set_function(telegram_limiter.queue_depth)
+            metrics.OUTBOX_QUEUE.set_function(outbox.queue_depth)
+            metrics.CIRCUITS_OPEN.set_function(circuit_breakers.open_count)
+            metrics_runner = await metrics.start_metrics_server()
+
+        if routes_telegram:
+            # Воркеры доставки ответов; при старте подхватывают недоставленное
+            await outbox.start(bot)
+
+        if polls_accounts:
+            if WEBHOOK_ENABLED:
+                # События приходят через вебхук, опрос остается редкой страховкой
+                webhook_runner = await start_webhook_server()
+                poll_scheduler = PollScheduler(
+                    bot,
+                    min_interval=WEBHOOK_SAFETY_POLL_INTERVAL,
+                    max_interval=max(WEBHOOK_SAFETY_POLL_INTERVAL, POLL_MAX_INTERVAL),
+                    account_filter=lease_manager.owns,
+                )
+                # Событие вебхука переносит опрос аккаунта в планировщике на сейчас
+                asyncio.create_task(webhook_consumer(poll_scheduler))
+            else:
+                poll_scheduler = PollScheduler(bot, min_interval=POLL_INTERVAL, account_filter=lease_manager.owns)
+
+            # Запускаем адаптивную проверку сообщений по аккаунтам
+            asyncio.create_task(poll_scheduler.run())
 
-    start_scheduler()
+        # Задача запускается везде, но выполняет очистку только лидер
+        start_scheduler()
 
-    await dp.start_polling(bot)
+        if routes_telegram:
+            await dp.start_polling(bot)
+        else:
+            # Опросчик не получает обновления Telegram, только отправляет сообщения
+            await asyncio.Event().wait()
+    finally:
+        if webhook_runner is not None:
+            await webhook_runner.cleanup()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await outbox.stop()
+        await lease_manager.stop()
+        await token_manager.stop()
+        await avito_client.close()
+        await diagnostics.stop()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # Запись логов идет в отдельном потоке, чтобы не блокировать цикл событий
+    setup_logging()
+    try:
+        asyncio.run(main())
+    finally:
+        stop_logging()
     
\ No newline at end of file
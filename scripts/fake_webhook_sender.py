@@ -0,0 +1,69 @@
+"""
+Локальный отправитель вебхуков: шлет записанные уведомления мессенджера Avito
+на сервер вебхуков бота, чтобы проверить режим приема событий без Avito.
+
+Пример:
+    python scripts/fake_webhook_sender.py --url http://127.0.0.1:8080/avito/webhook/<secret> \
+        --file payloads.json --repeat 3
+"""
+import argparse
+import asyncio
+import json
+import time
+import aiohttp
+
+SAMPLE_PAYLOAD = {
+    "id": "b5c3a9d2-0000-0000-0000-000000000000",
+    "version": "v3.0.0",
+    "timestamp": 1700000000,
+    "payload": {
+        "type": "message",
+        "value": {
+            "id": "sample-message-id",
+            "chat_id": "u2i-sample-chat",
+            "user_id": 123456789,
+            "author_id": 987654321,
+            "created": 1700000000,
+            "type": "text",
+            "chat_type": "u2i",
+            "content": {"text": "Здравствуйте! Объявление актуально?"},
+            "item_id": 1234567890,
+            "published_at": "2023-11-14T22:13:20Z",
+        },
+    },
+}
+
+
+def load_payloads(path):
+    if not path:
+        return [SAMPLE_PAYLOAD]
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return data if isinstance(data, list) else [data]
+
+
+async def send_payloads(url, payloads, repeat, delay):
+    async with aiohttp.ClientSession() as session:
+        for _ in range(repeat):
+            for payload in payloads:
+                started = time.monotonic()
+                async with session.post(url, json=payload) as response:
+                    elapsed = (time.monotonic() - started) * 1000
+                    print(f"{response.status} {elapsed:.1f} мс {payload.get('id')}")
+                if delay:
+                    await asyncio.sleep(delay)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Отправка записанных вебхуков Avito на локальный сервер бота")
+    parser.add_argument("--url", required=True, help="Адрес вебхука бота, включая секрет")
+    parser.add_argument("--file", help="JSON-файл с одним уведомлением или списком уведомлений")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--delay", type=float, default=0.0, help="Пауза между запросами, с")
+    args = parser.parse_args()
+
+    asyncio.run(send_payloads(args.url, load_payloads(args.file), args.repeat, args.delay))
+
+
+if __name__ == "__main__":
+    main()
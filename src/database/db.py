@@ -1,15 +1,227 @@
+import logging
+import time
+from sqlalchemy import BigInteger, event, inspect, text
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from src.models.base import Base
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from config import (
+    DATABASE_URL,
+    DB_ECHO,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_QUERY_CACHE_SIZE,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_CACHE_SIZE_KB,
+    SQLITE_MMAP_SIZE,
+    PG_STATEMENT_CACHE_SIZE,
+    RETENTION_INCREMENTAL_VACUUM,
+)
+from src.models import Base, MessageLink
+from src.services import metrics
 
+logger = logging.getLogger(__name__)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL позволяет читать параллельно с записью опросчика и обработчиков
+    cursor = dbapi_connection.cursor()
+    if RETENTION_INCREMENTAL_VACUUM:
+        # Действует только до создания первой таблицы или до VACUUM
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")  # Отрицательное значение — в КиБ
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute("PRAGMA foreign_keys=ON")  # Нужно для ON DELETE CASCADE
+    cursor.close()
+
+
+def create_engine_from_config(url: str = DATABASE_URL, echo: bool = DB_ECHO) -> AsyncEngine:
+    """
+    Создает асинхронный движок по настройкам: SQLite (aiosqlite) с WAL и прагмами
+    на каждом соединении или PostgreSQL (asyncpg) с пулом соединений.
+    """
+    options = {
+        "echo": echo,
+        "query_cache_size": DB_QUERY_CACHE_SIZE,
+    }
+
+    if url.startswith("sqlite"):
+        if ":memory:" not in url:
+            options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+        new_engine = create_async_engine(url, **options)
+        event.listen(new_engine.sync_engine, "connect", _set_sqlite_pragmas)
+        return new_engine
+
+    if url.startswith("postgresql"):
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+            connect_args={"prepared_statement_cache_size": PG_STATEMENT_CACHE_SIZE},
+        )
+
+    return create_async_engine(url, **options)
+
+
+class TimedAsyncSession(AsyncSession):
+    """AsyncSession, который при включенных метриках замеряет длительность блока async with."""
+
+    async def __aenter__(self):
+        self._metrics_started = time.perf_counter()
+        return await super().__aenter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            await super().__aexit__(exc_type, exc, tb)
+        finally:
+            metrics.DB_SESSION_SECONDS.observe(time.perf_counter() - self._metrics_started)
 
-DATABASE_URL = "sqlite+aiosqlite:///./database.db"
 
 # Создание движка для базы данных
-engine = create_async_engine(DATABASE_URL, echo=True)
-async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+engine = create_engine_from_config()
+async_session = sessionmaker(
+    engine, expire_on_commit=False, class_=TimedAsyncSession if metrics.enabled else AsyncSession
+)
+
+
+def insert_ignore_conflicts(model, rows, index_elements):
+    """
+    INSERT нескольких строк, пропускающий конфликты по уникальному индексу
+    (ON CONFLICT DO NOTHING для диалекта текущего движка).
+    """
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model).values(rows).on_conflict_do_nothing(index_elements=index_elements)
+
+
+def upsert(model, rows, index_elements, update_columns):
+    """
+    INSERT нескольких строк, обновляющий update_columns при конфликте по уникальному индексу
+    (ON CONFLICT DO UPDATE для диалекта текущего движка).
+    """
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(model).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=index_elements, set_={column: stmt.excluded[column] for column in update_columns}
+    )
+
+
+# Колонки, добавленные в существующие таблицы после первого выпуска:
+# (таблица, колонка, DDL-тип, SQL для заполнения старых строк, индекс)
+_ADDED_COLUMNS = [
+    (
+        "message_links", "created_at", "TIMESTAMP",
+        "UPDATE message_links SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL",
+        "CREATE INDEX IF NOT EXISTS ix_message_links_created_at ON message_links (created_at)",
+    ),
+]
+
+# Индексы, которых нет в базах, созданных старыми версиями
+_ADDED_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_message_links_user_id ON message_links (user_id)",
+    "CREATE INDEX IF NOT EXISTS ix_outbox_messages_created_at ON outbox_messages (created_at)",
+]
+
+
+# Колонки с ID Telegram, созданные как INTEGER: в PostgreSQL это int4, а ID Telegram бывают больше 2^31.
+# В SQLite INTEGER и так 64-битный, расширение нужно только другим базам
+_WIDENED_COLUMNS = [
+    ("users", "user_id"),
+    ("users", "telegram_chat_id"),
+    ("outbox_messages", "telegram_chat_id"),
+    ("outbox_messages", "reply_to_message_id"),
+]
+
+
+# Индексы, дублирующие другие и удаленные из моделей
+_DROPPED_INDEXES = [
+    "ix_telegram_message_id",  # Дублировал уникальное ограничение на message_links.telegram_message_id
+]
+
+
+def _upgrade_message_links(sync_conn, inspector):
+    """
+    Переводит message_links с ключа telegram_message_id на (telegram_chat_id, telegram_message_id):
+    message_id в Telegram уникален только внутри чата. Чат берется из пользователя связи;
+    связи без пользователя или его чата не восстановить, они не переносятся.
+    """
+    columns = {info["name"] for info in inspector.get_columns("message_links")}
+    if "telegram_chat_id" in columns:
+        return
+    if sync_conn.dialect.name == "sqlite":
+        # Ограничение UNIQUE в SQLite не удалить — таблица пересоздается
+        copied = ["id", "telegram_message_id", "avito_chat_id", "avito_user_id", "user_id", "avito_message_id", "created_at"]
+        sync_conn.execute(text("ALTER TABLE message_links RENAME TO message_links_old"))
+        for index in inspector.get_indexes("message_links_old"):
+            sync_conn.execute(text(f"DROP INDEX IF EXISTS {index['name']}"))
+        MessageLink.__table__.create(sync_conn)
+        sync_conn.execute(text(
+            f"INSERT INTO message_links ({', '.join(copied)}, telegram_chat_id) "
+            f"SELECT {', '.join('old.' + column for column in copied)}, users.telegram_chat_id "
+            "FROM message_links_old old JOIN users ON users.id = old.user_id "
+            "WHERE users.telegram_chat_id IS NOT NULL"
+        ))
+        sync_conn.execute(text("DROP TABLE message_links_old"))
+    else:
+        for statement in (
+            "ALTER TABLE message_links ADD COLUMN telegram_chat_id BIGINT",
+            "UPDATE message_links SET telegram_chat_id = "
+            "(SELECT telegram_chat_id FROM users WHERE users.id = message_links.user_id)",
+            "DELETE FROM message_links WHERE telegram_chat_id IS NULL",
+            "ALTER TABLE message_links ALTER COLUMN telegram_chat_id SET NOT NULL",
+            "ALTER TABLE message_links DROP CONSTRAINT IF EXISTS message_links_telegram_message_id_key",
+            "ALTER TABLE message_links ADD CONSTRAINT uq_message_link_telegram "
+            "UNIQUE (telegram_chat_id, telegram_message_id)",
+        ):
+            sync_conn.execute(text(statement))
+    logger.info("message_links переведена на ключ (telegram_chat_id, telegram_message_id)")
+
+
+def _upgrade_schema(sync_conn):
+    inspector = inspect(sync_conn)
+    for table, column, ddl_type, backfill, index in _ADDED_COLUMNS:
+        columns = {info["name"] for info in inspector.get_columns(table)}
+        if column in columns:
+            continue
+        sync_conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+        if backfill:
+            sync_conn.execute(text(backfill))
+        if index:
+            sync_conn.execute(text(index))
+        logger.info("Добавлена колонка %s.%s", table, column)
+    _upgrade_message_links(sync_conn, inspector)
+    if sync_conn.dialect.name != "sqlite":
+        for table, column in _WIDENED_COLUMNS:
+            info = next(info for info in inspector.get_columns(table) if info["name"] == column)
+            if not isinstance(info["type"], BigInteger):
+                sync_conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE BIGINT"))
+                logger.info("Колонка %s.%s расширена до BIGINT", table, column)
+    for index in _ADDED_INDEXES:
+        sync_conn.execute(text(index))
+    for index in _DROPPED_INDEXES:
+        sync_conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
 
 
-# Создание сессии
-Session = sessionmaker(bind=engine)
-session = Session()
\ No newline at end of file
+async def init_db():
+    """Создает недостающие таблицы и дополняет схему существующей базы."""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_upgrade_schema)
+        if RETENTION_INCREMENTAL_VACUUM and engine.dialect.name == "sqlite":
+            mode = await conn.execute(text("PRAGMA auto_vacuum"))
+            if mode.scalar() != 2:  # 2 — INCREMENTAL
+                logger.warning(
+                    "База создана без auto_vacuum=INCREMENTAL, место после очистки не вернется; "
+                    "перестройте ее один раз при остановленном боте: "
+                    "sqlite3 <файл базы> \"PRAGMA auto_vacuum=INCREMENTAL; VACUUM;\""
+                )
@@ -0,0 +1,31 @@
+import logging
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, FSInputFile
+from src.services.diagnostics import diagnostics
+from config import ADMIN_IDS, PROFILE_POLLS
+
+admin_router = Router()
+
+logger = logging.getLogger(__name__)
+
+
+@admin_router.message(Command("profile"))
+async def profile_command(message: Message, command: CommandObject):
+    """Профиль следующих N опросов аккаунтов: /profile [N]. Доступно только администраторам."""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("❌ Команда доступна только администраторам")
+        return
+    polls = int(command.args) if command.args and command.args.strip().isdigit() else PROFILE_POLLS
+
+    future = diagnostics.start_profile(polls)
+    if future is None:
+        await message.answer("❌ Диагностика выключена, включите DIAGNOSTICS_ENABLED")
+        return
+    await message.answer(f"⏳ Профилирование запущено на {polls} опросов аккаунтов")
+
+    path = await future
+    if path is None:
+        await message.answer("❌ Не удалось записать профиль, подробности в логах")
+        return
+    await message.answer_document(FSInputFile(path), caption=f"📊 Профиль: {path}")
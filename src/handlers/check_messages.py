@@ -2,7 +2,7 @@ import logging
 from aiogram import types, Router
 from sqlalchemy import select
 from src.models.message_link import MessageLink
-from src.services.message_service import send_message_to_avito
+from src.services.outbox_service import outbox
 from src.database.db import async_session
 from src.models.user import User
 
@@ -26,33 +26,39 @@ async def handle_incoming_reply(message: types.Message):
 
     reply_to_message_id = message.reply_to_message.message_id
     reply_text = message.text
+    if not reply_text:
+        await message.reply("❌ В Avito можно отправить только текстовый ответ")
+        return
 
     try:
-        response = await send_message_to_avito(reply_to_message_id, reply_text)
-        
-        # Исправленная проверка ответа
-        if response and isinstance(response, dict):
-            if "id" in response:
-                await message.reply("✅ Ответ успешно отправлен в Avito")
-                logging.info(f"Успешный ответ: {response['id']}")
-            else:
-                error_msg = response.get("error", "Неизвестная ошибка")
-                await message.reply(f"❌ Ошибка Avito: {error_msg}")
-                logging.error(f"Ошибка API: {error_msg}")
+        # Ответ сохраняется в outbox и доставляется воркерами; статус обновится в этом сообщении
+        status_message = await message.reply("⏳ Ответ принят, отправляем в Avito")
+        queued = await outbox.enqueue(
+            telegram_chat_id=message.chat.id,
+            telegram_message_id=message.message_id,
+            reply_to_message_id=reply_to_message_id,
+            text=reply_text,
+            status_message_id=status_message.message_id,
+        )
+        if queued is None:
+            await status_message.edit_text("❌ Не найден чат Avito для этого сообщения")
+            logging.error("MessageLink не найден для ID: %s", reply_to_message_id)
         else:
-            await message.reply("❌ Не удалось отправить сообщение")
-            logging.error("Пустой ответ от API")
+            logging.info("Ответ поставлен в очередь: %s", queued.idempotency_key)
             
     except Exception as e:
         await message.reply(f"⛔ Ошибка: {str(e)}")
-        logging.error(f"Критическая ошибка: {str(e)}")
+        logging.error("Критическая ошибка: %s", e)
 
         
-async def save_message_link(reply_to_message_id, telegram_message_id, avito_message_id):
+async def save_message_link(telegram_chat_id, reply_to_message_id, telegram_message_id, avito_message_id):
     async with async_session() as session:
-        # Получаем связь с сообщением
+        # Получаем связь с сообщением; message_id уникален только внутри чата
         message_link = await session.execute(
-            select(MessageLink).where(MessageLink.telegram_message_id == reply_to_message_id)
+            select(MessageLink).where(
+                MessageLink.telegram_chat_id == telegram_chat_id,
+                MessageLink.telegram_message_id == reply_to_message_id,
+            )
         )
         message_link = message_link.scalar_one_or_none()
 
@@ -60,6 +66,7 @@ async def save_message_link(reply_to_message_id, telegram_message_id, avito_mess
             user = await session.get(User, message_link.user_id)
             if user:
                 new_link = MessageLink(
+                    telegram_chat_id=telegram_chat_id,
                     telegram_message_id=telegram_message_id,
                     avito_chat_id=message_link.avito_chat_id,
                     avito_user_id=user.avito_user_id,
@@ -69,6 +76,6 @@ async def save_message_link(reply_to_message_id, telegram_message_id, avito_mess
                 session.add(new_link)
                 await session.commit()
             else:
-                logging.error(f"Пользователь с ID {message_link.user_id} не найден.")
+                logging.error("Пользователь с ID %s не найден.", message_link.user_id)
         else:
-            logging.error(f"Связь с сообщением {reply_to_message_id} не найдена в базе данных.")
\ No newline at end of file
+            logging.error("Связь с сообщением %s не найдена в базе данных.", reply_to_message_id)
\ No newline at end of file
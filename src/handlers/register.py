@@ -4,14 +4,20 @@ from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from sqlalchemy import select
+from src.models.user import User
 from src.handlers.start import delete_account
 from src.database.db import async_session
 from src.services.user_service import get_or_create_user
-from src.services.avito_api import get_access_token, get_self_info
+from src.services.avito_api import get_self_info, subscribe_webhook
+from src.services.token_manager import token_manager
+from src.services.routing_cache import routing_cache
+from src.services.circuit_breaker import circuit_breakers
+from src.services.webhook_service import get_webhook_url
+from config import WEBHOOK_ENABLED
 
 register_router = Router()
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class AuthStates(StatesGroup):
@@ -46,33 +52,46 @@ async def process_client_secret(message: Message, state: FSMContext):
     client_id = data.get("client_id")
     client_secret = message.text
 
+    # Сначала проверяем данные: опечатка не должна заменить рабочие учетные данные аккаунта
+    access_token = await token_manager.check(client_id, client_secret)
+    if not access_token:
+        await message.answer("❌ Не удалось получить токен доступа")
+        return
+    self_info = await get_self_info(access_token)
+    if not (self_info and "id" in self_info):
+        await message.answer("❌ Не удалось получить ID пользователя Avito")
+        return
+
     async with async_session() as session:
+        previous = await session.execute(
+            select(User.client_id, User.client_secret, User.avito_user_id).where(User.user_id == message.from_user.id)
+        )
+        previous = previous.first()
+
         # Получаем или создаем пользователя
         user = await get_or_create_user(session, message.from_user.id, client_id, client_secret)
-        
-        # Получаем токен доступа
-        access_token = await get_access_token(client_id, client_secret)
-        if access_token:
-            self_info = await get_self_info(access_token)
-            if self_info and "id" in self_info:
-                user.avito_user_id = str(self_info["id"])
-                logger.info(f"Сохранен avito_user_id: {user.avito_user_id}")
-            else:
-                await message.answer("❌ Не удалось получить ID пользователя Avito")
-                return
-        else:
-            await message.answer("❌ Не удалось получить токен доступа")
-            return
-        
+        user.avito_user_id = str(self_info["id"])
+        logger.info("Сохранен avito_user_id: %s", user.avito_user_id)
+
         # Сохраняем данные пользователя
         user.telegram_chat_id = message.chat.id
-        
-        # Очистка кэша при изменении учетных данных
-        global access_token_cache
-        access_token_cache = {}
-        
+
         await session.commit()
 
+    # Учетные данные сменились — сбрасываем старый токен и карантин аккаунта
+    if previous is not None and (previous.client_id, previous.client_secret) != (client_id, client_secret):
+        for old_client_id in {previous.client_id, client_id}:
+            await token_manager.invalidate(old_client_id)
+        circuit_breakers.reset(previous.client_id, previous.avito_user_id, client_id, user.avito_user_id)
+
+    if WEBHOOK_ENABLED and not await subscribe_webhook(access_token, get_webhook_url()):
+        logger.warning("Не удалось подписать avito_user_id %s на вебхук", user.avito_user_id)
+
+    # Ответы на старые сообщения пойдут с новыми учетными данными
+    routing_cache.set_account(
+        user.id, user.avito_user_id, user.client_id, user.client_secret, user.telegram_chat_id
+    )
+
     await message.answer("✅ Данные успешно сохранены!")
     await state.clear()
     
\ No newline at end of file
@@ -6,6 +6,11 @@ from aiogram.fsm.state import State, StatesGroup
 from sqlalchemy import select
 from src.models.user import User
 from src.database.db import async_session
+from src.services.token_manager import token_manager
+from src.services.user_service import delete_user
+from src.services.routing_cache import routing_cache
+from src.services.chat_service import chat_directory
+from src.services.circuit_breaker import circuit_breakers
 
 start_router = Router()
 
@@ -39,8 +44,12 @@ async def process_delete_account(message: Message, state: FSMContext):
             user = await session.execute(select(User).where(User.user_id == user_id))
             user = user.scalar_one_or_none()
             if user:
-                await session.delete(user)
-                await session.commit()
+                await delete_user(session, user)
+                await token_manager.invalidate(user.client_id)
+                routing_cache.invalidate_user(user.id)
+                circuit_breakers.reset(user.client_id, user.avito_user_id)
+                if user.avito_user_id:
+                    chat_directory.forget_account(user.avito_user_id)
                 await message.answer("Аккаунт удален.")
             else:
                 await message.answer("Аккаунт не найден.")
@@ -1,5 +1,13 @@
 from .base import Base
 from .user import User
 from .message_link import MessageLink
+from .chat_cursor import ChatCursor
+from .access_token import AccessToken
+from .outbox_message import OutboxMessage
+from .lease import Lease
+from .forwarded_message import ForwardedMessage
+from .media_file import MediaFile
+from .chat import Chat
+from .participant import Participant
 
-__all__ = ['Base', 'User', 'MessageLink']
\ No newline at end of file
+__all__ = ['Base', 'User', 'MessageLink', 'ChatCursor', 'AccessToken', 'OutboxMessage', 'Lease', 'ForwardedMessage', 'MediaFile', 'Chat', 'Participant']
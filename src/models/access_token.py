@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from src.models.base import Base
+
+class AccessToken(Base):
+    __tablename__ = 'access_tokens'
+
+    id = Column(Integer, primary_key=True)
+    client_id = Column(String(255), nullable=False, unique=True)
+    secret_hash = Column(String(64), nullable=False)  # sha256 от client_secret, сам секрет не храним
+    access_token = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)  # UTC
@@ -0,0 +1,19 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint
+from src.models.base import Base
+
+class Chat(Base):
+    __tablename__ = 'chats'
+
+    id = Column(Integer, primary_key=True)
+    avito_account_id = Column(String(255), nullable=False)  # avito_user_id владельца аккаунта
+    avito_chat_id = Column(String(255), nullable=False)
+    counterpart_id = Column(String(255))  # Собеседник в чате
+    item_id = Column(String(255))  # Объявление, по которому идет чат (для u2i)
+    item_title = Column(String(512))
+    item_url = Column(String(1024))
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # UTC, последнее изменение данных
+
+    __table_args__ = (
+        UniqueConstraint('avito_account_id', 'avito_chat_id', name='uq_chat'),
+    )
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, String, UniqueConstraint
+from src.models.base import Base
+
+class ChatCursor(Base):
+    __tablename__ = 'chat_cursors'
+
+    id = Column(Integer, primary_key=True)
+    avito_account_id = Column(String(255), nullable=False)  # avito_user_id владельца аккаунта
+    avito_chat_id = Column(String(255), nullable=False)
+    last_message_id = Column(String(255))  # Последнее обработанное сообщение
+    last_message_created = Column(Integer)  # Unix-время последнего сообщения чата
+
+    __table_args__ = (
+        UniqueConstraint('avito_account_id', 'avito_chat_id', name='uq_chat_cursor'),
+    )
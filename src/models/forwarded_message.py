@@ -0,0 +1,18 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from src.models.base import Base
+
+class ForwardedMessage(Base):
+    __tablename__ = 'forwarded_messages'
+
+    id = Column(Integer, primary_key=True)
+    avito_message_id = Column(String(255), nullable=False, unique=True)  # Повторная пересылка отсекается ограничением
+    avito_chat_id = Column(String(255), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    telegram_message_id = Column(Integer, nullable=False)  # Сообщение или дайджест, в котором переслано
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # UTC
+
+    __table_args__ = (
+        Index('ix_forwarded_messages_created_at', 'created_at'),
+        Index('ix_forwarded_messages_user_id', 'user_id'),
+    )
@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from src.models.base import Base
+
+class Lease(Base):
+    __tablename__ = 'leases'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(255), nullable=False, unique=True)  # "account:<id>", "poller:<воркер>", "leader"
+    owner = Column(String(255), nullable=False)
+    expires_at = Column(DateTime, nullable=False)  # UTC
+    heartbeat_at = Column(DateTime, nullable=False)  # UTC
@@ -0,0 +1,18 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, Index
+from src.models.base import Base
+
+class MediaFile(Base):
+    __tablename__ = 'media_files'
+
+    id = Column(Integer, primary_key=True)
+    content_hash = Column(String(64), nullable=False, unique=True)  # sha256 содержимого
+    source_key = Column(String(512))  # Адрес изображения или id голосового в Avito
+    kind = Column(String(16), nullable=False)  # photo, document
+    file_id = Column(String(255), nullable=False)  # file_id в Telegram для повторной отправки
+    size = Column(Integer)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # UTC
+
+    __table_args__ = (
+        Index('ix_media_files_source_key', 'source_key'),
+    )
@@ -1,18 +1,23 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Index
+from datetime import datetime
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, Index, DateTime, UniqueConstraint
 from src.models.base import Base
 
 class MessageLink(Base):
     __tablename__ = 'message_links'
     
     id = Column(Integer, primary_key=True)
-    telegram_message_id = Column(Integer, nullable=False, unique=True)  # Оставляем unique
+    telegram_chat_id = Column(BigInteger, nullable=False)  # message_id в Telegram уникален только внутри чата
+    telegram_message_id = Column(Integer, nullable=False)
     avito_chat_id = Column(String(255), nullable=False)
     avito_user_id = Column(String(255), nullable=False)  # Исправлено на String
-    user_id = Column(Integer, ForeignKey('users.id'))
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'))
     avito_message_id = Column(String(255))  # Все ID как строки
+    created_at = Column(DateTime, default=datetime.utcnow)  # UTC, используется для очистки по возрасту
     
     __table_args__ = (
-        Index('ix_telegram_message_id', 'telegram_message_id'),
-        Index('ix_avito_chat_id', 'avito_chat_id')
+        # Уникальный индекс служит и для поиска
+        UniqueConstraint('telegram_chat_id', 'telegram_message_id', name='uq_message_link_telegram'),
+        Index('ix_avito_chat_id', 'avito_chat_id'),
+        Index('ix_message_links_created_at', 'created_at'),
+        Index('ix_message_links_user_id', 'user_id'),
     )
-    
\ No newline at end of file
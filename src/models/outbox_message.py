@@ -0,0 +1,26 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, Index
+from src.models.base import Base
+
+class OutboxMessage(Base):
+    __tablename__ = 'outbox_messages'
+
+    id = Column(Integer, primary_key=True)
+    idempotency_key = Column(String(255), nullable=False, unique=True)  # Одно исходное сообщение Telegram — одна отправка
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    avito_chat_id = Column(String(255), nullable=False)
+    reply_to_message_id = Column(BigInteger, nullable=False)  # Сообщение бота, на которое ответил пользователь
+    telegram_chat_id = Column(BigInteger, nullable=False)  # Как в message_links: ID чатов больше 2^31
+    status_message_id = Column(Integer)  # Сообщение бота со статусом доставки
+    text = Column(Text, nullable=False)
+    status = Column(String(16), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # UTC
+    avito_message_id = Column(String(255))
+    last_error = Column(Text)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # UTC
+
+    __table_args__ = (
+        Index('ix_outbox_status_chat', 'status', 'avito_chat_id', 'id'),
+        Index('ix_outbox_messages_created_at', 'created_at'),  # Очистка по возрасту
+    )
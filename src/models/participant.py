@@ -0,0 +1,12 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime
+from src.models.base import Base
+
+class Participant(Base):
+    __tablename__ = 'participants'
+
+    id = Column(Integer, primary_key=True)
+    avito_user_id = Column(String(255), nullable=False, unique=True)
+    name = Column(String(255))
+    profile_url = Column(String(1024))
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # UTC, последнее изменение данных
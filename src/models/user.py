@@ -1,14 +1,14 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, BigInteger, String
 from src.models.base import Base
 
 class User(Base):
     __tablename__ = 'users'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(Integer, unique=True, nullable=False)
+    user_id = Column(BigInteger, unique=True, nullable=False)  # ID Telegram не помещаются в int4
     client_id = Column(String, nullable=False)
     client_secret = Column(String, nullable=False)
-    telegram_chat_id = Column(Integer, nullable=True)
+    telegram_chat_id = Column(BigInteger, nullable=True)  # Супергруппы: -100…
     avito_user_id = Column(String, nullable=True)
 
 
@@ -1,23 +1,201 @@
 import logging
+import time
 import aiohttp
-from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+from src.services import metrics
+from src.services.avito_models import Chat, Message, Token
+from src.services.json_codec import dumps, loads
+from src.services.rate_limiter import KeyedRateLimiter, parse_retry_after
+from src.services.circuit_breaker import (
+    CircuitOpenError, circuit_breakers, classify_exception, classify_status
+)
+from config import (
+    AVITO_API_URL,
+    AVITO_GLOBAL_RPS,
+    AVITO_ACCOUNT_RPS,
+    AVITO_MAX_RETRIES,
+    AVITO_FETCH_MIN_SHARE,
+    AVITO_HOUSEKEEPING_MIN_SHARE,
+    AVITO_HTTP_LIMIT,
+    AVITO_HTTP_LIMIT_PER_HOST,
+    AVITO_HTTP_DNS_TTL,
+    AVITO_HTTP_KEEPALIVE,
+    AVITO_HTTP_TIMEOUT,
+    AVITO_HTTP_CONNECT_TIMEOUT,
+    AVITO_PAGE_SIZE,
+    AVITO_MAX_PAGES,
+)
 
-# Настройка логирования
-logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Классы приоритета запросов (меньше — важнее): лимиты Avito выдаются сначала ответам продавца
+PRIORITY_REPLY = 0
+PRIORITY_TOKEN = 1
+PRIORITY_FETCH = 2
+PRIORITY_HOUSEKEEPING = 3
 
-access_token_cache = {}
+_PRIORITIES = {
+    "send_message": PRIORITY_REPLY,
+    "get_access_token": PRIORITY_TOKEN,
+    "get_self_info": PRIORITY_FETCH,
+    "get_chats": PRIORITY_FETCH,
+    "get_chat": PRIORITY_FETCH,
+    "get_messages_from_chat": PRIORITY_FETCH,
+    "get_voice_url": PRIORITY_FETCH,
+}
 
-async def get_access_token(client_id, client_secret):
-    cache_key = (client_id, client_secret)
-    cached = access_token_cache.get(cache_key)
-    
-    if cached and datetime.now() < cached['expires']:
-        logger.info(f"Используем кэшированный токен: {cached['token'][:10]}...")
-        return cached['token']
 
-    url = "https://api.avito.ru/token/"
+class AvitoAPIError(Exception):
+    """Avito ответил ошибкой или неожиданным телом на запрос списка."""
+
+    def __init__(self, operation: str, status: int, body=None):
+        super().__init__(f"{operation}: статус {status}, ответ {body}")
+        self.operation = operation
+        self.status = status
+
+
+class AvitoClient:
+    """
+    Долгоживущий HTTP-клиент Avito: одна сессия aiohttp на весь процесс
+    с пулом keep-alive соединений и кэшированием DNS.
+    """
+
+    def __init__(
+        self,
+        base_url: str = AVITO_API_URL,
+        limit: int = AVITO_HTTP_LIMIT,
+        limit_per_host: int = AVITO_HTTP_LIMIT_PER_HOST,
+        dns_ttl: int = AVITO_HTTP_DNS_TTL,
+        keepalive_timeout: float = AVITO_HTTP_KEEPALIVE,
+        timeout: float = AVITO_HTTP_TIMEOUT,
+        connect_timeout: float = AVITO_HTTP_CONNECT_TIMEOUT,
+        global_rps: float = AVITO_GLOBAL_RPS,
+        account_rps: float = AVITO_ACCOUNT_RPS,
+        max_retries: int = AVITO_MAX_RETRIES,
+        fetch_min_share: float = AVITO_FETCH_MIN_SHARE,
+        housekeeping_min_share: float = AVITO_HOUSEKEEPING_MIN_SHARE,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.limiter = KeyedRateLimiter(
+            global_rps, account_rps,
+            shares={PRIORITY_FETCH: fetch_min_share, PRIORITY_HOUSEKEEPING: housekeeping_min_share},
+        )
+        self.max_retries = max_retries
+        self._session = None
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_ttl,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        return aiohttp.ClientSession(connector=connector, timeout=self.timeout, json_serialize=dumps)
+
+    async def start(self):
+        """Создает сессию. Должен вызываться внутри запущенного event loop."""
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+            logger.info("HTTP-клиент Avito запущен")
+        return self
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("HTTP-клиент Avito остановлен")
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # Ленивое создание на случай вызова до start() (например, из скриптов)
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+        return self._session
+
+    def url(self, path: str) -> str:
+        # Абсолютные адреса (файлы на CDN Avito) используются как есть
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{self.base_url}{path}"
+
+    @asynccontextmanager
+    async def request(
+        self, method: str, path: str, account=None, operation: str = "other", limited: bool = True,
+        priority: int = None, **kwargs
+    ):
+        """
+        Выполняет запрос с учетом лимитов: общего и для аккаунта account.
+        На 429 ждет Retry-After и повторяет запрос до max_retries раз,
+        после чего отдает вызывающему последний ответ.
+        operation — имя функции API для метрик; limited=False — запрос вне лимитов API (скачивание файлов).
+        priority — класс приоритета в очереди лимитов; по умолчанию определяется по operation.
+        Если аккаунт на карантине для класса операции, бросает CircuitOpenError без обращения к Avito.
+        """
+        circuit_breakers.before_request(account, operation)
+        if priority is None:
+            priority = _PRIORITIES.get(operation, PRIORITY_HOUSEKEEPING)
+        for attempt in range(self.max_retries + 1):
+            if limited:
+                try:
+                    await self.limiter.acquire(account, priority)
+                except BaseException:
+                    circuit_breakers.abandon(account, operation)
+                    raise
+            started = time.perf_counter()
+            try:
+                response = await self.session.request(method, self.url(path), **kwargs)
+            except Exception as e:
+                metrics.AVITO_REQUESTS.inc(operation, "error")
+                kind = classify_exception(e)
+                if kind is None:
+                    circuit_breakers.abandon(account, operation)
+                else:
+                    circuit_breakers.record(account, operation, kind)
+                raise
+            except BaseException:
+                circuit_breakers.abandon(account, operation)
+                raise
+            finally:
+                metrics.AVITO_REQUEST_SECONDS.observe(time.perf_counter() - started, operation)
+            metrics.AVITO_REQUESTS.inc(operation, str(response.status))
+            if response.status == 429 and attempt < self.max_retries:
+                delay = parse_retry_after(response.headers.get("Retry-After"))
+                response.release()
+                self.limiter.penalize(account, delay)
+                logger.warning("Avito ответил 429 на %s, повтор через %.1f с", path, delay)
+                continue
+            circuit_breakers.record(account, operation, classify_status(operation, response.status))
+            try:
+                yield response
+            finally:
+                response.release()
+            return
+
+
+# Общий клиент процесса; создается в main.py при старте и закрывается при остановке
+avito_client = AvitoClient()
+
+
+async def read_json(response: aiohttp.ClientResponse, default=None):
+    """Тело ответа как JSON: один проход по байтам без промежуточной строки; default, если это не JSON."""
+    try:
+        return loads(await response.read())
+    except ValueError:
+        return default
+
+
+async def request_access_token(client_id, client_secret, track: bool = True):
+    """
+    Запрашивает новый токен доступа у Avito.
+    Возвращает Token или None при ошибке.
+    track=False — проверка введенных данных: отказ не учитывается выключателем аккаунта.
+    Кэширование и обновление токенов — в src/services/token_manager.py.
+    """
     data = {
         "grant_type": "client_credentials",
         "client_id": client_id,
@@ -25,31 +203,30 @@ async def get_access_token(client_id, client_secret):
     }
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, data=data) as response:
-                logger.info(f"Статус запроса токена: {response.status}")
-                response_data = await response.json()
-                logger.info(f"Ответ Avito: {response_data}")
-
-                if response.status != 200:
-                    error_msg = response_data.get("error", "Неизвестная ошибка")
-                    raise Exception(f"Ошибка API: {error_msg}")
-
-                access_token = response_data.get('access_token')
-                expires_in = response_data.get('expires_in', 3600)
-                
-                if access_token:
-                    access_token_cache[cache_key] = {
-                        'token': access_token,
-                        'expires': datetime.now() + timedelta(seconds=expires_in)
-                    }
-                    logger.info(f"Новый токен получен: {access_token[:10]}...")
-                    return access_token
-                
-                logger.error("Access token не найден в ответе")
-                return None
+        async with avito_client.request(
+            "POST", "/token/", account=client_id if track else None, operation="get_access_token", data=data
+        ) as response:
+            logger.debug("Статус запроса токена: %s", response.status)
+            response_data = await read_json(response, {})
+
+            if response.status != 200:
+                error_msg = response_data.get("error", "Неизвестная ошибка")
+                raise Exception(f"Ошибка API: {error_msg}")
+
+            access_token = response_data.get('access_token')
+            expires_in = response_data.get('expires_in', 3600)
+            
+            if access_token:
+                logger.info("Новый токен получен для %s, срок %s с", client_id, expires_in)
+                return Token(access_token, expires_in)
+            
+            logger.error("Access token не найден в ответе")
+            return None
+    except CircuitOpenError as e:
+        logger.debug("Запрос токена пропущен: %s", e)
+        return None
     except Exception as e:
-        logger.error(f"Ошибка запроса токена: {str(e)}")
+        logger.error("Ошибка запроса токена: %s", e)
         return None
 
 
@@ -57,64 +234,126 @@ async def get_self_info(access_token):
     """
     Получает информацию о текущем аккаунте через API Авито.
     """
-    url = "https://api.avito.ru/core/v1/accounts/self"
     headers = {
         "Authorization": f"Bearer {access_token}"
     }
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url, headers=headers) as response:
-                response.raise_for_status()
-                return await response.json()
-        except Exception as e:
-            logger.error(f"Ошибка при запросе информации о аккаунте: {e}")
-            return None
+    try:
+        async with avito_client.request(
+            "GET", "/core/v1/accounts/self", operation="get_self_info", headers=headers
+        ) as response:
+            response.raise_for_status()
+            return await read_json(response)
+    except Exception as e:
+        logger.error("Ошибка при запросе информации о аккаунте: %s", e)
+        return None
 
 
-async def get_chats(access_token, user_id, unread_only=False):
-    url = f"https://api.avito.ru/messenger/v2/accounts/{user_id}/chats"
+async def _paginate(
+    path, key, account, operation, headers, parse, params=None, page_size=AVITO_PAGE_SIZE, priority=None
+):
+    """
+    Обходит постраничный список Avito (limit/offset) и отдает элементы по одному,
+    преобразованные функцией parse.
+    Следующая страница запрашивается, только когда вызывающий дочитал текущую,
+    поэтому прерванный обход (break) не делает лишних запросов.
+    Ответ с ошибкой прерывает обход исключением AvitoAPIError, чтобы вызывающий
+    отличал сбой от пустого списка.
+    """
+    params = dict(params or {})
+    for page in range(AVITO_MAX_PAGES):
+        params["limit"] = page_size
+        params["offset"] = page * page_size
+        async with avito_client.request(
+            "GET", path, account=account, operation=operation, headers=headers, params=params,
+            priority=priority,
+        ) as response:
+            data = await read_json(response)
+        items = data.get(key) if isinstance(data, dict) else None
+        if response.status != 200 or items is None:
+            raise AvitoAPIError(operation, response.status, data)
+        for item in items:
+            yield parse(item)
+        if len(items) < page_size:
+            return
+    logger.warning("%s: обход остановлен на пределе %s страниц", operation, AVITO_MAX_PAGES)
+
+
+async def get_chats(access_token, user_id, unread_only=False, page_size=AVITO_PAGE_SIZE):
+    """
+    Асинхронный генератор чатов аккаунта (Chat), от недавно активных к старым.
+    Страницы запрашиваются по мере чтения.
+    """
     headers = {
         "Authorization": f"Bearer {access_token}"
     }
     params = {
         "chat_types": "u2i,u2u"  # Включить чаты от пользователей и по объявлениям
     }
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers, params=params) as response:
-            return await response.json()
+    if unread_only:
+        params["unread_only"] = "true"
+    async for chat in _paginate(
+        f"/messenger/v2/accounts/{user_id}/chats", "chats", user_id, "get_chats", headers, Chat.from_json,
+        params, page_size,
+    ):
+        yield chat
 
 
-async def get_messages_from_chat(access_token, user_id, chat_id):
-    url = f"https://api.avito.ru/messenger/v3/accounts/{user_id}/chats/{chat_id}/messages/"
+async def get_messages_from_chat(access_token, user_id, chat_id, page_size=AVITO_PAGE_SIZE, priority=None):
+    """
+    Асинхронный генератор сообщений чата (Message), от новых к старым.
+    Вызывающий прерывает обход, дойдя до уже обработанного сообщения.
+    priority — класс приоритета, если чтение нужно не опросу (например, сверка перед повтором ответа).
+    """
     headers = {
         "Authorization": f"Bearer {access_token}"
     }
+    async for message in _paginate(
+        f"/messenger/v3/accounts/{user_id}/chats/{chat_id}/messages/", "messages", user_id,
+        "get_messages_from_chat", headers, Message.from_json, page_size=page_size, priority=priority
+    ):
+        yield message
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as response:
-            return await response.json()
+
+async def get_chat(access_token, user_id, chat_id):
+    """
+    Возвращает один чат (Chat) с собеседниками и объявлением или None.
+    """
+    headers = {
+        "Authorization": f"Bearer {access_token}"
+    }
+    try:
+        async with avito_client.request(
+            "GET", f"/messenger/v2/accounts/{user_id}/chats/{chat_id}", account=user_id,
+            operation="get_chat", headers=headers
+        ) as response:
+            response.raise_for_status()
+            data = await read_json(response)
+        return Chat.from_json(data) if isinstance(data, dict) and data.get("id") else None
+    except Exception as e:
+        logger.error("Ошибка при запросе чата %s: %s", chat_id, e)
+        return None
 
 
 async def mark_chat_as_read(access_token, user_id, chat_id):
     """
     Помечает чат как прочитанный через API Авито.
     """
-    url = f"https://api.avito.ru/messenger/v1/accounts/{user_id}/chats/{chat_id}/read"
     headers = {
         "Authorization": f"Bearer {access_token}"
     }
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.post(url, headers=headers) as response:
-                response.raise_for_status()
-                return await response.json()
-        except Exception as e:
-            logger.error(f"Ошибка при пометке чата как прочитанного: {e}")
-            return None
+    try:
+        async with avito_client.request(
+            "POST", f"/messenger/v1/accounts/{user_id}/chats/{chat_id}/read", account=user_id,
+            operation="mark_chat_as_read", headers=headers
+        ) as response:
+            response.raise_for_status()
+            return await read_json(response)
+    except Exception as e:
+        logger.error("Ошибка при пометке чата как прочитанного: %s", e)
+        return None
         
 
 async def send_message(access_token, avito_user_id, avito_chat_id, message_text):
-    url = f"https://api.avito.ru/messenger/v1/accounts/{avito_user_id}/chats/{avito_chat_id}/messages"
     headers = {
         "Authorization": f"Bearer {access_token}",
         "Content-Type": "application/json"
@@ -126,35 +365,80 @@ async def send_message(access_token, avito_user_id, avito_chat_id, message_text)
         "type": "text"
     }
     
-    logger.info(f"Отправка сообщения в Avito: {message_text[:50]}...")  # Логируем начало
+    logger.debug("Отправка сообщения в Avito: %s...", message_text[:50])  # Логируем начало
     
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.post(url, headers=headers, json=data) as response:
-                response_body = await response.text()
-                logger.debug(f"Ответ Avito: {response.status} {response_body}")
-                
-                # Исправленная проверка статуса
-                if response.status != 200:
-                    logger.error(f"Ошибка API: {response.status}")
-                    return None
-                
-                return await response.json()
-                
-        except Exception as e:
-            logger.error(f"Ошибка отправки: {str(e)}")
-            return None
+    try:
+        async with avito_client.request(
+            "POST",
+            f"/messenger/v1/accounts/{avito_user_id}/chats/{avito_chat_id}/messages",
+            account=avito_user_id,
+            operation="send_message",
+            headers=headers,
+            json=data,
+        ) as response:
+            # Тело читается один раз: и для лога, и для разбора
+            response_body = await response.read()
+            logger.debug("Ответ Avito: %s %s", response.status, response_body)
+
+            if response.status != 200:
+                logger.error("Ошибка API: %s", response.status)
+                return None
+
+            return loads(response_body)
+            
+    except Exception as e:
+        logger.error("Ошибка отправки: %s", e)
+        return None
+
+
+async def get_voice_url(access_token, user_id, voice_id):
+    """
+    Возвращает адрес файла голосового сообщения или None.
+    """
+    headers = {
+        "Authorization": f"Bearer {access_token}"
+    }
+    try:
+        async with avito_client.request(
+            "GET", f"/messenger/v1/accounts/{user_id}/getVoiceFiles", account=user_id,
+            operation="get_voice_url", headers=headers, params={"voice_ids": voice_id}
+        ) as response:
+            response.raise_for_status()
+            data = await read_json(response, {})
+            return (data.get("voices_urls") or {}).get(voice_id)
+    except Exception as e:
+        logger.error("Ошибка получения голосового сообщения %s: %s", voice_id, e)
+        return None
 
 
 async def get_user_info(access_token, user_id):
-    url = f"https://api.avito.ru/core/v1/accounts/{user_id}"
     headers = {
         "Authorization": f"Bearer {access_token}"
     }
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as response:
-            if response.status == 200:
-                return await response.json()
-            else:
-                return None
-            
\ No newline at end of file
+    async with avito_client.request(
+        "GET", f"/core/v1/accounts/{user_id}", operation="get_user_info", headers=headers
+    ) as response:
+        if response.status == 200:
+            return await read_json(response)
+        else:
+            return None
+
+
+async def subscribe_webhook(access_token, webhook_url):
+    """
+    Подписывает аккаунт на уведомления мессенджера Avito о новых сообщениях.
+    """
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json"
+    }
+    try:
+        async with avito_client.request(
+            "POST", "/messenger/v3/webhook", operation="subscribe_webhook",
+            headers=headers, json={"url": webhook_url}
+        ) as response:
+            response.raise_for_status()
+            return await read_json(response)
+    except Exception as e:
+        logger.error("Ошибка подписки на вебхук: %s", e)
+        return None
@@ -0,0 +1,87 @@
+from dataclasses import dataclass
+from typing import Optional
+
+# Ответы API Avito в компактном виде: только поля, которые использует бот.
+# Отдельно от моделей базы (src/models): Chat и Participant там — таблицы.
+
+
+@dataclass(slots=True)
+class Participant:
+    id: str
+    name: str
+    profile_url: str
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Participant":
+        return cls(
+            id=str(data.get("id")),
+            name=data.get("name") or "",
+            profile_url=(data.get("public_user_profile") or {}).get("url", ""),
+        )
+
+
+@dataclass(slots=True)
+class Message:
+    id: str
+    author_id: Optional[str]
+    direction: Optional[str]  # in или out
+    type: Optional[str]  # text, image, voice, file, link, item, location...
+    created: int
+    content: dict
+    is_read: bool
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Message":
+        author_id = (data.get("author") or {}).get("id") or data.get("author_id")
+        return cls(
+            id=str(data["id"]),
+            author_id=str(author_id) if author_id else None,
+            direction=data.get("direction"),
+            type=data.get("type"),
+            created=data.get("created") or 0,
+            content=data.get("content") or {},
+            is_read=bool(data.get("isRead")),
+        )
+
+
+@dataclass(slots=True)
+class Chat:
+    id: str
+    participants: dict  # id собеседника -> Participant, в порядке ответа Avito
+    item_id: Optional[str]
+    item_title: Optional[str]
+    item_url: Optional[str]
+    last_message_id: Optional[str]  # Маркер последнего сообщения для курсора чата
+    last_message_created: Optional[int]
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Chat":
+        participants = {}
+        for user in data.get("users") or ():
+            participant = Participant.from_json(user)
+            participants[participant.id] = participant
+        item = (data.get("context") or {}).get("value") or {}
+        last_message = data.get("last_message") or {}
+        return cls(
+            id=data["id"],
+            participants=participants,
+            item_id=str(item["id"]) if item.get("id") else None,
+            item_title=item.get("title"),
+            item_url=item.get("url"),
+            last_message_id=str(last_message["id"]) if last_message.get("id") is not None else None,
+            last_message_created=last_message.get("created"),
+        )
+
+    def counterpart(self, account_id: str) -> Optional[Participant]:
+        """Собеседник аккаунта; если в чате только сам аккаунт — он же."""
+        account_id = str(account_id)
+        for participant_id, participant in self.participants.items():
+            if participant_id != account_id:
+                return participant
+        return self.participants.get(account_id)
+
+
+@dataclass(slots=True)
+class Token:
+    access_token: str
+    expires_in: int
@@ -0,0 +1,191 @@
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple, Optional
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.models.chat import Chat
+from src.models.participant import Participant
+from src.services import avito_models
+from src.database.db import async_session
+from src.services.avito_api import get_chat
+from config import CHAT_CACHE_SIZE, CHAT_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_SENDER = "Неизвестный отправитель"
+
+
+class ChatInfo(NamedTuple):
+    counterpart_id: Optional[str]
+    counterpart_name: str
+    profile_url: str
+    item_id: Optional[str]
+    item_title: Optional[str]
+    item_url: Optional[str]
+
+
+def parse_chat(account_id: str, chat: avito_models.Chat) -> Optional[ChatInfo]:
+    """Собирает данные чата из ответа Avito; None, если в ответе нет собеседников."""
+    counterpart = chat.counterpart(account_id)
+    if counterpart is None:
+        return None
+    return ChatInfo(
+        counterpart_id=counterpart.id,
+        counterpart_name=counterpart.name or UNKNOWN_SENDER,
+        profile_url=counterpart.profile_url,
+        item_id=chat.item_id,
+        item_title=chat.item_title,
+        item_url=chat.item_url,
+    )
+
+
+class ChatDirectory:
+    """
+    Данные чатов и собеседников: имя и профиль собеседника, объявление чата.
+    Источник — список чатов, который опрос получает все равно; в базу пишутся только изменения.
+    Чтение: LRU-кэш с TTL в памяти, затем таблицы chats/participants, и лишь затем API Avito.
+    """
+
+    def __init__(self, maxsize: int = CHAT_CACHE_SIZE, ttl: float = CHAT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._chats = OrderedDict()  # (account_id, chat_id) -> (ChatInfo, срок)
+        self._dirty = {}  # (account_id, chat_id) -> ChatInfo, ожидающие записи в базу
+
+    def _get(self, key) -> Optional[ChatInfo]:
+        entry = self._chats.get(key)
+        if entry is None:
+            return None
+        info, expires = entry
+        if expires < time.monotonic():
+            del self._chats[key]
+            return None
+        self._chats.move_to_end(key)
+        return info
+
+    def _put(self, key, info: ChatInfo):
+        self._chats[key] = (info, time.monotonic() + self.ttl)
+        self._chats.move_to_end(key)
+        while len(self._chats) > self.maxsize:
+            self._chats.popitem(last=False)
+
+    def observe(self, account_id: str, chat: avito_models.Chat) -> Optional[ChatInfo]:
+        """
+        Учитывает чат из списка Avito. Если данные отличаются от известных,
+        обновляет кэш и ставит запись в очередь на сохранение (flush).
+        """
+        key = (str(account_id), chat.id)
+        info = parse_chat(account_id, chat)
+        if info is None:
+            return self._get(key)
+        if self._get(key) != info:
+            self._dirty[key] = info
+        self._put(key, info)
+        return info
+
+    async def resolve(self, account_id: str, chat_id: str, access_token: str = None) -> Optional[ChatInfo]:
+        """Данные чата без списка чатов на руках (ответы, история): кэш, база, затем API."""
+        key = (str(account_id), chat_id)
+        info = self._get(key)
+        if info is not None:
+            return info
+
+        info = await self._load(key)
+        if info is not None:
+            self._put(key, info)
+            return info
+        if access_token:
+            chat = await get_chat(access_token, account_id, chat_id)
+            if chat:
+                return self.observe(account_id, chat)
+        return None
+
+    async def _load(self, key) -> Optional[ChatInfo]:
+        async with async_session() as session:
+            row = await session.execute(
+                select(Chat, Participant)
+                .outerjoin(Participant, Participant.avito_user_id == Chat.counterpart_id)
+                .where(Chat.avito_account_id == key[0], Chat.avito_chat_id == key[1])
+            )
+            row = row.first()
+        if row is None:
+            return None
+        chat, participant = row
+        return ChatInfo(
+            counterpart_id=chat.counterpart_id,
+            counterpart_name=(participant.name if participant else None) or UNKNOWN_SENDER,
+            profile_url=(participant.profile_url if participant else None) or "",
+            item_id=chat.item_id,
+            item_title=chat.item_title,
+            item_url=chat.item_url,
+        )
+
+    async def flush(self):
+        """
+        Сохраняет накопленные изменения отдельной транзакцией: сбой (например, гонка вставки
+        одного собеседника из двух аккаунтов) не затрагивает связи сообщений и курсоры.
+        Существующие строки обновляются, только если данные действительно поменялись.
+        """
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        try:
+            async with async_session() as session:
+                await self._write(session, dirty)
+                await session.commit()
+        except Exception as e:
+            logger.warning("Не удалось сохранить данные чатов: %s", e)
+
+    async def _write(self, session: AsyncSession, dirty: dict):
+        now = datetime.utcnow()
+
+        rows = await session.execute(
+            select(Chat).where(tuple_(Chat.avito_account_id, Chat.avito_chat_id).in_(list(dirty)))
+        )
+        chats = {(row.avito_account_id, row.avito_chat_id): row for row in rows.scalars().all()}
+        participants = {}
+        for info in dirty.values():
+            if info.counterpart_id:
+                participants[info.counterpart_id] = info
+        rows = await session.execute(
+            select(Participant).where(Participant.avito_user_id.in_(list(participants)))
+        )
+        known = {row.avito_user_id: row for row in rows.scalars().all()}
+
+        for (account_id, chat_id), info in dirty.items():
+            row = chats.get((account_id, chat_id))
+            if row is None:
+                row = Chat(avito_account_id=account_id, avito_chat_id=chat_id)
+                session.add(row)
+            values = {
+                "counterpart_id": info.counterpart_id,
+                "item_id": info.item_id,
+                "item_title": info.item_title,
+                "item_url": info.item_url,
+            }
+            if any(getattr(row, name) != value for name, value in values.items()):
+                for name, value in values.items():
+                    setattr(row, name, value)
+                row.updated_at = now
+
+        for user_id, info in participants.items():
+            row = known.get(user_id)
+            if row is None:
+                row = Participant(avito_user_id=user_id)
+                session.add(row)
+            if (row.name, row.profile_url) != (info.counterpart_name, info.profile_url):
+                row.name = info.counterpart_name
+                row.profile_url = info.profile_url
+                row.updated_at = now
+
+    def forget_account(self, account_id: str):
+        account_id = str(account_id)
+        for key in [key for key in self._chats if key[0] == account_id]:
+            del self._chats[key]
+        for key in [key for key in self._dirty if key[0] == account_id]:
+            del self._dirty[key]
+
+
+chat_directory = ChatDirectory()
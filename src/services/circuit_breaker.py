@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+import aiohttp
+from src.services import metrics
+from config import CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_OPEN_DELAY, CIRCUIT_MAX_OPEN_DELAY
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Виды сбоев
+AUTH = "auth"
+RATE_LIMIT = "rate_limit"
+SERVER = "server"
+TIMEOUT = "timeout"
+
+# Класс запросов по имени операции API; остальные операции — чтение мессенджера
+_ENDPOINTS = {
+    "get_access_token": "token",
+    "send_message": "send",
+}
+
+# Классы, от которых зависит опрос аккаунта; сбои отправки ответов повторяет outbox
+_POLL_ENDPOINTS = ("token", "read")
+
+_ENDPOINT_CLASSES = ("token", "read", "send")
+
+
+def endpoint_class(operation: str) -> str:
+    return _ENDPOINTS.get(operation, "read")
+
+
+def classify_status(operation: str, status: int) -> Optional[str]:
+    """Вид сбоя по статусу ответа или None, если ответ не говорит о неисправности аккаунта."""
+    if status in (401, 403):
+        return AUTH
+    if status == 429:
+        return RATE_LIMIT
+    if status >= 500:
+        return SERVER
+    # Отозванный client_secret Avito возвращает как 400 на запрос токена
+    if operation == "get_access_token" and 400 <= status < 500:
+        return AUTH
+    return None
+
+
+def classify_exception(exc: BaseException) -> Optional[str]:
+    if isinstance(exc, asyncio.TimeoutError):
+        return TIMEOUT
+    if isinstance(exc, aiohttp.ClientConnectionError):
+        return SERVER
+    return None
+
+
+class CircuitOpenError(Exception):
+    """Запрос не выполнен: аккаунт на карантине для этого класса запросов."""
+
+    def __init__(self, account: str, endpoint: str, retry_in: float):
+        super().__init__(f"{endpoint} для {account} на карантине еще {retry_in:.0f} с")
+        self.account = account
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class Circuit:
+    """Состояние одного выключателя: аккаунт и класс запросов."""
+
+    __slots__ = ("state", "failures", "opens", "kind", "open_until", "probing")
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0  # Ошибок подряд в замкнутом состоянии
+        self.opens = 0  # Размыканий подряд без успешной пробы; задает длину паузы
+        self.kind = None  # Вид последнего сбоя
+        self.open_until = 0.0
+        self.probing = False  # Пробный запрос в полуоткрытом состоянии уже выполняется
+
+
+class CircuitBreakers:
+    """
+    Выключатели по паре (аккаунт Avito, класс запросов: token, read, send):
+    - closed — запросы идут; после threshold ошибок подряд размыкается, после отказа в токене — сразу
+      (401 на чтении может означать лишь устаревший токен в кэше, его обновит следующий опрос);
+    - open — запросы отклоняются без обращения к Avito, пауза удваивается с каждым размыканием;
+    - half_open — после паузы пропускается один пробный запрос: успех замыкает, сбой снова размыкает.
+    Опрос аккаунта на карантине, пока разомкнут выключатель token или read; о начале карантина
+    пользователь узнает один раз (take_notice).
+    """
+
+    def __init__(
+        self,
+        threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        open_delay: float = CIRCUIT_OPEN_DELAY,
+        max_open_delay: float = CIRCUIT_MAX_OPEN_DELAY,
+    ):
+        self.threshold = max(threshold, 1)
+        self.open_delay = open_delay
+        self.max_open_delay = max(max_open_delay, open_delay)
+        self._circuits = {}  # (аккаунт, класс) -> Circuit
+        self._notices = {}  # аккаунт -> вид сбоя, о котором еще не сообщили пользователю
+
+    def _circuit(self, account: str, endpoint: str) -> Circuit:
+        key = (account, endpoint)
+        circuit = self._circuits.get(key)
+        if circuit is None:
+            circuit = self._circuits[key] = Circuit()
+        return circuit
+
+    def _set_state(self, account: str, endpoint: str, circuit: Circuit, state: str):
+        circuit.state = state
+        self._publish_states()
+        metrics.CIRCUIT_TRANSITIONS.inc(endpoint, state)
+
+    def _publish_states(self):
+        """
+        Пересчитывает число незамкнутых выключателей по классу и состоянию.
+        Аккаунт в метку не попадает: client_id — учетные данные, и ряд на аккаунт раздувал бы метрики.
+        """
+        if not metrics.enabled:
+            return
+        counts = {(endpoint, state): 0 for endpoint in _ENDPOINT_CLASSES for state in (HALF_OPEN, OPEN)}
+        for (_, endpoint), circuit in self._circuits.items():
+            if circuit.state != CLOSED:
+                counts[endpoint, circuit.state] += 1
+        for labels, count in counts.items():
+            metrics.CIRCUITS_BY_STATE.set(count, *labels)
+
+    def before_request(self, account, operation: str):
+        """Пропускает запрос или бросает CircuitOpenError. В полуоткрытом состоянии пропускает одну пробу."""
+        if account is None:
+            return
+        account = str(account)
+        endpoint = endpoint_class(operation)
+        circuit = self._circuits.get((account, endpoint))
+        if circuit is None or circuit.state == CLOSED:
+            return
+        now = time.monotonic()
+        if circuit.state == OPEN and now >= circuit.open_until:
+            self._set_state(account, endpoint, circuit, HALF_OPEN)
+            logger.info("Пробный запрос %s для %s после карантина", endpoint, account)
+        if circuit.state == HALF_OPEN and not circuit.probing:
+            circuit.probing = True
+            return
+        raise CircuitOpenError(account, endpoint, max(circuit.open_until - now, 0))
+
+    def record(self, account, operation: str, kind: Optional[str]):
+        """Учитывает исход запроса: kind — вид сбоя или None при успехе."""
+        if account is None:
+            return
+        account = str(account)
+        endpoint = endpoint_class(operation)
+        circuit = self._circuits.get((account, endpoint))
+        if kind is None:
+            if circuit is not None and (circuit.state != CLOSED or circuit.failures):
+                if circuit.state != CLOSED:
+                    logger.info("Карантин %s для %s снят", endpoint, account)
+                    self._set_state(account, endpoint, circuit, CLOSED)
+                circuit.failures = circuit.opens = 0
+                circuit.probing = False
+                circuit.kind = None
+            return
+
+        metrics.CIRCUIT_FAILURES.inc(endpoint, kind)
+        if circuit is None:
+            circuit = self._circuit(account, endpoint)
+        circuit.kind = kind
+        circuit.probing = False
+        if circuit.state == CLOSED:
+            circuit.failures += 1
+            if not (kind == AUTH and endpoint == "token") and circuit.failures < self.threshold:
+                return
+            if endpoint in _POLL_ENDPOINTS:
+                # Начало карантина — сообщим пользователю после опроса
+                self._notices.setdefault(account, kind)
+        elif circuit.state == OPEN:
+            return
+        circuit.failures = 0
+        circuit.opens += 1
+        delay = min(self.open_delay * 2 ** (circuit.opens - 1), self.max_open_delay)
+        circuit.open_until = time.monotonic() + delay
+        self._set_state(account, endpoint, circuit, OPEN)
+        logger.warning("Карантин %s для %s на %.0f с: %s", endpoint, account, delay, kind)
+
+    def abandon(self, account, operation: str):
+        """Проба прервана без ответа (например, отменой задачи) — следующий запрос станет новой пробой."""
+        if account is None:
+            return
+        circuit = self._circuits.get((str(account), endpoint_class(operation)))
+        if circuit is not None:
+            circuit.probing = False
+
+    def quarantined(self, *accounts) -> bool:
+        """Опрос аккаунтов на карантине: выключатель разомкнут и пауза не истекла или идет проба."""
+        now = time.monotonic()
+        accounts = {str(account) for account in accounts if account}
+        return any(
+            circuit.state != CLOSED and (circuit.open_until > now or circuit.probing)
+            for (account, endpoint), circuit in self._circuits.items()
+            if account in accounts and endpoint in _POLL_ENDPOINTS
+        )
+
+    def retry_in(self, *accounts) -> float:
+        """Секунд до конца карантина опроса: до пробы по последнему из разомкнутых выключателей."""
+        now = time.monotonic()
+        accounts = {str(account) for account in accounts if account}
+        delays = [
+            circuit.open_until - now
+            for (account, endpoint), circuit in self._circuits.items()
+            if account in accounts and endpoint in _POLL_ENDPOINTS and circuit.state == OPEN
+        ]
+        return max(max(delays), 0) if delays else 0.0
+
+    def take_notice(self, *accounts) -> Optional[str]:
+        """Вид сбоя, с которого начался карантин аккаунта, если пользователь о нем еще не знает."""
+        kind = None
+        for account in accounts:
+            if account:
+                kind = self._notices.pop(str(account), None) or kind
+        return kind
+
+    def reset(self, *accounts):
+        """Снимает карантин, например после ввода новых учетных данных."""
+        accounts = {str(account) for account in accounts if account}
+        for key in [key for key in self._circuits if key[0] in accounts]:
+            del self._circuits[key]
+        self._publish_states()
+        for account in accounts:
+            self._notices.pop(account, None)
+
+    def open_count(self) -> int:
+        return sum(1 for circuit in self._circuits.values() if circuit.state != CLOSED)
+
+    def snapshot(self) -> list:
+        """Незамкнутые выключатели для операторов: аккаунт, класс, состояние, вид сбоя, секунд до пробы."""
+        now = time.monotonic()
+        return [
+            {
+                "account": account,
+                "endpoint": endpoint,
+                "state": circuit.state,
+                "kind": circuit.kind,
+                "retry_in": round(max(circuit.open_until - now, 0), 1),
+            }
+            for (account, endpoint), circuit in self._circuits.items()
+            if circuit.state != CLOSED
+        ]
+
+
+circuit_breakers = CircuitBreakers()
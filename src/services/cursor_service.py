@@ -0,0 +1,47 @@
+from sqlalchemy import lambda_stmt, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.models.chat_cursor import ChatCursor
+from src.services.avito_models import Chat
+from src.database.db import upsert
+
+async def get_chat_cursors(session: AsyncSession, avito_account_id: str) -> dict:
+    """
+    Возвращает курсоры всех чатов аккаунта в виде словаря {avito_chat_id: ChatCursor}.
+    """
+    result = await session.execute(
+        lambda_stmt(lambda: select(ChatCursor).where(ChatCursor.avito_account_id == avito_account_id))
+    )
+    return {cursor.avito_chat_id: cursor for cursor in result.scalars().all()}
+
+
+def chat_marker_moved(cursor: ChatCursor, chat: Chat) -> bool:
+    """
+    Проверяет, появились ли в чате сообщения после сохраненного курсора.
+    Без маркера last_message считаем, что чат изменился.
+    """
+    if cursor is None or chat.last_message_id is None:
+        return True
+    return chat.last_message_id != cursor.last_message_id
+
+
+async def save_chat_cursors(session: AsyncSession, avito_account_id: str, chats: list):
+    """
+    Сдвигает курсоры на маркер last_message переданных чатов одной транзакцией.
+    Запись идет через upsert: курсор, созданный параллельно другим процессом, обновляется,
+    а не обрывает транзакцию вместе со связями сообщений.
+    """
+    rows = [
+        {
+            "avito_account_id": avito_account_id,
+            "avito_chat_id": chat.id,
+            "last_message_id": chat.last_message_id,
+            "last_message_created": chat.last_message_created,
+        }
+        for chat in chats
+        if chat.last_message_id is not None
+    ]
+    if rows:
+        await session.execute(upsert(
+            ChatCursor, rows, ["avito_account_id", "avito_chat_id"], ["last_message_id", "last_message_created"]
+        ))
+    await session.commit()
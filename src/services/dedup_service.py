@@ -0,0 +1,49 @@
+from collections import OrderedDict
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.models.forwarded_message import ForwardedMessage
+from config import FORWARD_SEEN_CACHE_SIZE
+
+
+class RecentlySeen:
+    """Ограниченное множество id недавно пересланных сообщений; при переполнении вытесняются самые старые."""
+
+    def __init__(self, maxsize: int = FORWARD_SEEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._ids = OrderedDict()
+
+    def __contains__(self, message_id: str) -> bool:
+        return message_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, message_id: str):
+        self._ids[message_id] = None
+        self._ids.move_to_end(message_id)
+        while len(self._ids) > self.maxsize:
+            self._ids.popitem(last=False)
+
+    def clear(self):
+        self._ids.clear()
+
+
+recently_seen = RecentlySeen()
+
+
+async def filter_unseen(session: AsyncSession, message_ids: list) -> list:
+    """
+    Оставляет id сообщений, которые еще не пересылались, в исходном порядке:
+    сначала проверка по памяти, оставшиеся — одним запросом к forwarded_messages.
+    """
+    candidates = [message_id for message_id in message_ids if message_id not in recently_seen]
+    if not candidates:
+        return []
+
+    result = await session.execute(
+        select(ForwardedMessage.avito_message_id).where(ForwardedMessage.avito_message_id.in_(candidates))
+    )
+    known = set(result.scalars().all())
+    for message_id in known:
+        recently_seen.add(message_id)
+    return [message_id for message_id in candidates if message_id not in known]
@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+from src.services import metrics
+from config import (
+    DIAGNOSTICS_ENABLED,
+    LOOP_LAG_INTERVAL,
+    LOOP_LAG_WARN,
+    SLOW_CALLBACK_THRESHOLD,
+    PROFILE_DIR,
+    PROFILE_POLLS,
+    PROFILE_HZ,
+    PROFILE_MAX_SECONDS,
+    LOG_THROTTLE,
+)
+
+logger = logging.getLogger(__name__)
+
+# Этапы опроса аккаунта в разбивке времени
+POLL_PHASES = ("token", "chats", "messages", "telegram", "db", "mark_read")
+
+
+class PhaseTimer:
+    """Суммарное время по этапам одного опроса аккаунта."""
+
+    __slots__ = ("phases",)
+
+    def __init__(self):
+        self.phases = dict.fromkeys(POLL_PHASES, 0.0)
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    async def iterate(self, name: str, iterable):
+        """Обходит асинхронный генератор, относя ожидание каждого элемента к этапу name."""
+        iterator = iterable.__aiter__()
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    self.add(name, time.perf_counter() - started)
+                yield item
+        finally:
+            if hasattr(iterator, "aclose"):
+                await iterator.aclose()
+
+    def observe(self):
+        for name, seconds in self.phases.items():
+            metrics.POLL_PHASE_SECONDS.observe(seconds, name)
+
+    def __str__(self):
+        return ", ".join(f"{name} {seconds:.3f}" for name, seconds in self.phases.items())
+
+
+class Diagnostics:
+    """
+    Диагностика одного процесса, включается DIAGNOSTICS_ENABLED:
+    - задача в цикле событий замеряет его задержку (метрика loop_lag_seconds);
+    - сторожевой поток замечает, что цикл не отвечает дольше slow_threshold,
+      и логирует стек кода, который его блокирует;
+    - по команде /profile или сигналу SIGUSR1 тот же поток снимает стеки цикла событий
+      с частотой profile_hz на протяжении N опросов аккаунтов и пишет их в файл
+      в формате collapsed stacks (flamegraph.pl, speedscope).
+    """
+
+    def __init__(
+        self,
+        enabled: bool = DIAGNOSTICS_ENABLED,
+        lag_interval: float = LOOP_LAG_INTERVAL,
+        lag_warn: float = LOOP_LAG_WARN,
+        slow_threshold: float = SLOW_CALLBACK_THRESHOLD,
+        profile_dir: str = PROFILE_DIR,
+        profile_hz: float = PROFILE_HZ,
+        profile_max_seconds: float = PROFILE_MAX_SECONDS,
+    ):
+        self.enabled = enabled
+        self.lag_interval = lag_interval
+        self.lag_warn = lag_warn
+        self.slow_threshold = slow_threshold
+        self.profile_dir = profile_dir
+        self.profile_hz = profile_hz
+        self.profile_max_seconds = profile_max_seconds
+        self._loop = None
+        self._loop_thread_id = None
+        self._tick = 0.0  # Последнее пробуждение задачи замера; по нему поток видит блокировку
+        self._lag_task = None
+        self._thread = None
+        self._stopping = threading.Event()
+        # Профиль: пишет поток, завершает цикл событий
+        self._lock = threading.Lock()
+        self._samples = None  # Counter свернутых стеков, пока идет профилирование
+        self._polls_left = 0
+        self._profile_future = None
+        self._profile_timeout = None
+
+    # --- запуск ---
+
+    def start(self):
+        if not self.enabled:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._tick = time.monotonic()
+        self._lag_task = asyncio.create_task(self._measure_lag())
+        self._thread = threading.Thread(target=self._watch, name="diagnostics", daemon=True)
+        self._thread.start()
+        try:
+            self._loop.add_signal_handler(signal.SIGUSR1, self._on_signal)
+        except (AttributeError, NotImplementedError, RuntimeError):
+            pass  # Нет SIGUSR1 (Windows) — остается команда /profile
+        logger.info(
+            "Диагностика включена: порог блокировки цикла %.3f с, профили в %s", self.slow_threshold, self.profile_dir
+        )
+
+    async def stop(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            try:
+                await self._lag_task
+            except asyncio.CancelledError:
+                pass
+            self._lag_task = None
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    # --- задержка цикла событий ---
+
+    async def _measure_lag(self):
+        while True:
+            expected = time.monotonic() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            now = time.monotonic()
+            self._tick = now
+            lag = max(now - expected, 0.0)
+            metrics.LOOP_LAG_SECONDS.observe(lag)
+            if lag > self.lag_warn:
+                logger.warning("Задержка цикла событий %.3f с", lag, extra={"throttle": LOG_THROTTLE})
+
+    # --- сторожевой поток ---
+
+    def _loop_frame(self):
+        return sys._current_frames().get(self._loop_thread_id)
+
+    def _watch(self):
+        reported_tick = None
+        while not self._stopping.is_set():
+            profiling = self._samples is not None
+            self._stopping.wait(1 / self.profile_hz if profiling else self.slow_threshold / 4)
+
+            if profiling:
+                frame = self._loop_frame()
+                if frame is not None:
+                    stack = _fold(frame)
+                    with self._lock:
+                        if self._samples is not None:
+                            self._samples[stack] += 1
+
+            tick = self._tick
+            blocked = time.monotonic() - tick - self.lag_interval
+            if blocked > self.slow_threshold and tick != reported_tick:
+                reported_tick = tick
+                frame = self._loop_frame()
+                if frame is not None:
+                    logger.warning(
+                        "Цикл событий заблокирован дольше %.3f с, стек:\n%s",
+                        blocked, "".join(traceback.format_stack(frame)).rstrip(),
+                    )
+
+    # --- профилирование ---
+
+    @property
+    def profiling(self) -> bool:
+        return self._samples is not None
+
+    def start_profile(self, polls: int = PROFILE_POLLS) -> Optional[asyncio.Future]:
+        """
+        Начинает профиль следующих polls опросов аккаунтов.
+        Возвращает future с путем к файлу профиля (None, если записать не удалось)
+        или None, если диагностика выключена.
+        Повторный вызов во время профилирования возвращает текущий future.
+        """
+        if not self.enabled:
+            return None
+        if self._profile_future is not None:
+            return self._profile_future
+        self._polls_left = max(polls, 1)
+        self._profile_future = self._loop.create_future()
+        self._profile_timeout = self._loop.call_later(self.profile_max_seconds, self._finish_profile)
+        with self._lock:
+            self._samples = Counter()
+        logger.info("Профилирование %s опросов аккаунтов начато", self._polls_left)
+        return self._profile_future
+
+    def _on_signal(self):
+        self.start_profile()
+
+    def poll_done(self):
+        """Отмечает завершенный опрос аккаунта; после N опросов профиль записывается."""
+        if self._samples is None:
+            return
+        self._polls_left -= 1
+        if self._polls_left <= 0:
+            self._finish_profile()
+
+    def _finish_profile(self):
+        if self._profile_future is None:
+            return
+        with self._lock:
+            samples, self._samples = self._samples, None
+        future, self._profile_future = self._profile_future, None
+        self._profile_timeout.cancel()
+        task = asyncio.ensure_future(asyncio.to_thread(self._write_profile, samples))
+        task.add_done_callback(lambda done: _resolve(future, done))
+
+    def _write_profile(self, samples: Counter) -> str:
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f"poll-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded")
+        with open(path, "w", encoding="utf-8") as handle:
+            for stack, count in samples.most_common():
+                handle.write(f"{stack} {count}\n")
+        logger.info("Профиль записан: %s (снимков стека %s)", path, sum(samples.values()))
+        return path
+
+
+def _fold(frame) -> str:
+    """Стек в одну строку от внешнего вызова к текущему: формат collapsed stacks."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _resolve(future: asyncio.Future, done: asyncio.Future):
+    if future.done():
+        return
+    if done.exception() is not None:
+        logger.error("Не удалось записать профиль: %s", done.exception())
+        future.set_result(None)
+    else:
+        future.set_result(done.result())
+
+
+diagnostics = Diagnostics()
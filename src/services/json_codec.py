@@ -0,0 +1,22 @@
+import json
+
+# orjson заметно быстрее разбирает ответы Avito; без него используется стандартный json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    def loads(data):
+        """Разбирает JSON из bytes или str."""
+        return orjson.loads(data)
+
+    def dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+else:
+    def loads(data):
+        """Разбирает JSON из bytes или str."""
+        return json.loads(data)
+
+    def dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import math
+import os
+import socket
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, or_, select, update
+from src.models.lease import Lease
+from src.models.user import User
+from src.database.db import async_session, insert_ignore_conflicts
+from config import SHARDING_ENABLED, WORKER_ID, LEASE_TTL, LEASE_HEARTBEAT
+
+logger = logging.getLogger(__name__)
+
+LEADER_LEASE = "leader"
+POLLER_PREFIX = "poller:"
+ACCOUNT_PREFIX = "account:"
+
+
+class LeaseManager:
+    """
+    Аренды в таблице leases для работы нескольких процессов с одной базой:
+    - аккаунты делятся между процессами-опросчиками поровну, каждый держит аренды своих аккаунтов;
+    - аренды продлеваются heartbeat-ом, истекшие аренды упавших процессов перехватываются;
+    - аренда "leader" определяет процесс, выполняющий плановые задачи.
+    Без SHARDING_ENABLED процесс считается единственным: владеет всеми аккаунтами и является лидером.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = SHARDING_ENABLED,
+        worker_id: str = WORKER_ID,
+        ttl: float = LEASE_TTL,
+        heartbeat: float = LEASE_HEARTBEAT,
+    ):
+        self.enabled = enabled
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self.polls_accounts = False
+        self._accounts = set()  # Арендованные id пользователей
+        self._leader = False
+        self._task = None
+
+    # --- состояние ---
+
+    def owns(self, user_pk: int) -> bool:
+        return not self.enabled or user_pk in self._accounts
+
+    @property
+    def is_leader(self) -> bool:
+        return not self.enabled or self._leader
+
+    # --- операции с арендами ---
+
+    async def _try_acquire(self, session, name: str, now: datetime) -> bool:
+        expires_at = now + timedelta(seconds=self.ttl)
+        result = await session.execute(
+            update(Lease)
+            .where(Lease.name == name, or_(Lease.owner == self.worker_id, Lease.expires_at < now))
+            .values(owner=self.worker_id, expires_at=expires_at, heartbeat_at=now)
+        )
+        if result.rowcount:
+            return True
+        result = await session.execute(insert_ignore_conflicts(
+            Lease,
+            [{"name": name, "owner": self.worker_id, "expires_at": expires_at, "heartbeat_at": now}],
+            ["name"],
+        ))
+        return bool(result.rowcount)
+
+    async def _renew(self, session, names, now: datetime) -> set:
+        """Продлевает аренды и возвращает те, что остались за этим процессом."""
+        if not names:
+            return set()
+        await session.execute(
+            update(Lease)
+            .where(Lease.owner == self.worker_id, Lease.name.in_(names))
+            .values(expires_at=now + timedelta(seconds=self.ttl), heartbeat_at=now)
+        )
+        held = await session.execute(
+            select(Lease.name).where(Lease.owner == self.worker_id, Lease.name.in_(names))
+        )
+        return set(held.scalars().all())
+
+    async def rebalance(self):
+        """Один шаг heartbeat: продление, подсчет живых опросчиков и добор или сдача аккаунтов."""
+        now = datetime.utcnow()
+        async with async_session() as session:
+            names = [ACCOUNT_PREFIX + str(pk) for pk in self._accounts]
+            if self.polls_accounts:
+                names.append(POLLER_PREFIX + self.worker_id)
+                # Свою аренду опросчика берем заново на случай, если она истекла
+                await self._try_acquire(session, POLLER_PREFIX + self.worker_id, now)
+            held = await self._renew(session, names, now)
+            lost = {pk for pk in self._accounts if ACCOUNT_PREFIX + str(pk) not in held}
+            if lost:
+                logger.warning("Потеряны аренды аккаунтов: %s", sorted(lost))
+            self._accounts -= lost
+
+            self._leader = await self._try_acquire(session, LEADER_LEASE, now)
+
+            if self.polls_accounts:
+                await self._balance_accounts(session, now)
+            await session.commit()
+
+    async def _balance_accounts(self, session, now: datetime):
+        pollers = await session.execute(
+            select(func.count(Lease.id)).where(Lease.name.like(POLLER_PREFIX + "%"), Lease.expires_at >= now)
+        )
+        pollers = max(pollers.scalar() or 0, 1)
+        user_pks = await session.execute(select(User.id).order_by(User.id))
+        user_pks = user_pks.scalars().all()
+        target = math.ceil(len(user_pks) / pollers)
+
+        # Сдаем лишнее, чтобы новые процессы получили свою долю
+        excess = sorted(self._accounts)[target:]
+        if excess:
+            await session.execute(
+                delete(Lease).where(
+                    Lease.owner == self.worker_id,
+                    Lease.name.in_([ACCOUNT_PREFIX + str(pk) for pk in excess]),
+                )
+            )
+            self._accounts -= set(excess)
+
+        # Добираем свободные и истекшие аккаунты до своей доли
+        for pk in user_pks:
+            if len(self._accounts) >= target:
+                break
+            if pk in self._accounts:
+                continue
+            if await self._try_acquire(session, ACCOUNT_PREFIX + str(pk), now):
+                self._accounts.add(pk)
+
+    async def release_all(self):
+        async with async_session() as session:
+            await session.execute(delete(Lease).where(Lease.owner == self.worker_id))
+            await session.commit()
+        self._accounts.clear()
+        self._leader = False
+
+    # --- фоновый цикл ---
+
+    async def _run(self):
+        while True:
+            try:
+                await self.rebalance()
+            except Exception as e:
+                logger.error("Ошибка продления аренд: %s", e)
+            await asyncio.sleep(self.heartbeat)
+
+    async def start(self, polls_accounts: bool):
+        if not self.enabled:
+            return
+        self.polls_accounts = polls_accounts
+        await self.rebalance()
+        logger.info("Воркер %s: аккаунтов %s, лидер: %s", self.worker_id, len(self._accounts), self._leader)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.enabled:
+            await self.release_all()
+
+
+lease_manager = LeaseManager()
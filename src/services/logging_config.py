@@ -0,0 +1,150 @@
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from config import LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_FILE, LOG_FILE_MAX_BYTES, LOG_FILE_BACKUPS
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Значения, которые не должны попадать в логи: токены, секреты, заголовки авторизации
+_SECRET_PATTERNS = [
+    (re.compile(r"(Bearer\s+)[^\s\"',}]+", re.IGNORECASE), r"\1***"),
+    (
+        re.compile(
+            r"""(["']?(?:access_token|refresh_token|client_secret|secret|password|token)["']?\s*[:=]\s*["']?)[^\s"',&}]+""",
+            re.IGNORECASE,
+        ),
+        r"\1***",
+    ),
+    (re.compile(r"(/bot\d+:)[\w-]+"), r"\1***"),  # Токен Telegram-бота в URL
+]
+
+
+def redact(text: str) -> str:
+    for pattern, replacement in _SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class RedactingFilter(logging.Filter):
+    """Вырезает секреты из готового текста записи; стоит на обработчиках слушателя, вне цикла событий."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        redacted = redact(message)
+        if redacted != message:
+            record.msg = redacted
+            record.args = None
+        if record.exc_text:
+            record.exc_text = redact(record.exc_text)
+        return True
+
+
+class ThrottleFilter(logging.Filter):
+    """
+    Прореживает повторяющиеся записи. Запись с extra={"throttle": секунды} пропускается
+    не чаще раза в указанный интервал для пары (логгер, шаблон сообщения);
+    в пропущенную запись дописывается число подавленных повторов.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._last = {}  # (логгер, шаблон) -> (время последней записи, подавлено)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        interval = getattr(record, "throttle", None)
+        if not interval:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        last, suppressed = self._last.get(key, (None, 0))
+        if last is not None and now - last < interval:
+            self._last[key] = (last, suppressed + 1)
+            return False
+        self._last[key] = (now, 0)
+        if suppressed:
+            record.msg = f"{record.msg} (повторов подавлено: {suppressed})"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _parse_levels(spec: str) -> dict:
+    """Разбирает строку вида "aiogram.event=WARNING,src.services.avito_api=DEBUG"."""
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.strip().partition("=")
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+_listener = None
+
+
+def setup_logging(
+    level: str = LOG_LEVEL,
+    levels: str = LOG_LEVELS,
+    fmt: str = LOG_FORMAT,
+    log_file: str = LOG_FILE,
+) -> logging.handlers.QueueListener:
+    """
+    Настраивает логирование процесса. QueueHandler.prepare на вызывающем потоке (обычно это поток
+    цикла событий) подставляет аргументы в сообщение и форматирует текст исключения, затем кладет
+    запись в очередь. Оформление по формату вывода, очистка от секретов и запись в stdout/файл
+    идут в потоке QueueListener, так что с цикла событий уходит только ввод-вывод.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    formatter = JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding="utf-8"
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        handler.addFilter(RedactingFilter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(ThrottleFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+    for name, module_level in _parse_levels(levels).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Дописывает оставшиеся в очереди записи и останавливает поток слушателя."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
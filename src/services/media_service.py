@@ -0,0 +1,234 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
+from aiogram.types import FSInputFile
+from sqlalchemy import delete, select
+from src.models.media_file import MediaFile
+from src.services.avito_models import Message
+from src.database.db import async_session, insert_ignore_conflicts
+from src.services.avito_api import avito_client, get_voice_url
+from src.services.telegram_api import send_telegram_media
+from config import MEDIA_ENABLED, MEDIA_MAX_BYTES, MEDIA_CONCURRENCY, MEDIA_CHUNK_SIZE, MEDIA_TMP_DIR
+
+logger = logging.getLogger(__name__)
+
+# Telegram принимает фото до 10 МБ; больше — отправляем документом
+PHOTO_MAX_BYTES = 10 * 1024 * 1024
+# Сколько последних соответствий "вложение Avito -> file_id" держать в памяти
+SOURCE_CACHE_SIZE = 10000
+
+
+class _TooLarge(Exception):
+    pass
+
+
+class Attachment(NamedTuple):
+    kind: str  # photo, voice, file
+    source_key: str  # Стабильный идентификатор вложения в Avito
+    url: Optional[str]  # Для голосовых адрес получается отдельным запросом
+    filename: str
+
+
+def extract_attachment(message: Message) -> Optional[Attachment]:
+    """Возвращает вложение сообщения Avito или None для текста и прочих типов."""
+    if not MEDIA_ENABLED:
+        return None
+    content = message.content
+    message_type = message.type
+
+    if message_type == "image" and content.get("image"):
+        sizes = content["image"].get("sizes") or {}
+        if not sizes:
+            return None
+        # Ключи вида "1280x960": берем самое большое изображение
+        def area(size: str) -> int:
+            width, _, height = size.partition("x")
+            return int(width) * int(height) if width.isdigit() and height.isdigit() else 0
+        url = sizes[max(sizes, key=area)]
+        return Attachment("photo", url, url, "image.jpg")
+
+    if message_type == "voice" and content.get("voice"):
+        voice_id = content["voice"].get("voice_id")
+        if voice_id:
+            return Attachment("voice", f"voice:{voice_id}", None, f"voice-{voice_id}.m4a")
+
+    if message_type == "file" and content.get("file"):
+        url = content["file"].get("url")
+        if url:
+            return Attachment("file", url, url, content["file"].get("name") or "file")
+    return None
+
+
+class MediaForwarder:
+    """
+    Пересылка вложений из Avito в Telegram:
+    - файл скачивается через общий HTTP-клиент частями во временный файл, без загрузки в память;
+    - файлы больше max_bytes не скачиваются до конца — вызывающий отправит ссылку;
+    - отправленные файлы запоминаются по sha256 содержимого и адресу в Avito,
+      повторная отправка идет по file_id без скачивания и загрузки;
+    - file_id, который Telegram отклонил, забывается в памяти и в базе, а файл загружается заново;
+    - если Telegram не принял сам файл (размеры фото, объем), вызывающий получает None
+      и отправляет ссылку: одно вложение не должно останавливать проход аккаунта.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = MEDIA_MAX_BYTES,
+        concurrency: int = MEDIA_CONCURRENCY,
+        chunk_size: int = MEDIA_CHUNK_SIZE,
+        tmp_dir: str = MEDIA_TMP_DIR,
+    ):
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.tmp_dir = tmp_dir
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._by_source = OrderedDict()  # source_key -> (kind, file_id)
+
+    async def forward(
+        self, bot: Bot, chat_id: int, attachment: Attachment, access_token: str, avito_user_id: str, **kwargs
+    ):
+        """Отправляет вложение в чат Telegram. Возвращает отправленное сообщение или None."""
+        async with self._semaphore:
+            try:
+                return await self._forward(bot, chat_id, attachment, access_token, avito_user_id, **kwargs)
+            except TelegramAPIError as e:
+                logger.warning("Telegram не принял вложение %s, отправляем ссылку: %s", attachment.source_key, e)
+                return None
+
+    async def _forward(
+        self, bot: Bot, chat_id: int, attachment: Attachment, access_token: str, avito_user_id: str, **kwargs
+    ):
+        cached = self._by_source.get(attachment.source_key) or await self._lookup(
+            MediaFile.source_key == attachment.source_key
+        )
+        if cached:
+            sent = await self._send_cached(bot, chat_id, attachment, cached, **kwargs)
+            if sent is not None:
+                return sent
+
+        url = attachment.url
+        if url is None:
+            url = await get_voice_url(access_token, avito_user_id, attachment.source_key.split(":", 1)[1])
+            if not url:
+                return None
+
+        downloaded = await self._download(url)
+        if downloaded is None:
+            return None
+        path, content_hash, size = downloaded
+        try:
+            cached = await self._lookup(MediaFile.content_hash == content_hash)
+            if cached:
+                sent = await self._send_cached(bot, chat_id, attachment, cached, **kwargs)
+                if sent is not None:
+                    return sent
+
+            kind = "photo" if attachment.kind == "photo" and size <= PHOTO_MAX_BYTES else "document"
+            sent = await send_telegram_media(
+                bot, chat_id, kind, FSInputFile(path, filename=attachment.filename), **kwargs
+            )
+            file_id = _file_id(sent, kind)
+            if file_id:
+                await self._remember(attachment.source_key, content_hash, kind, file_id, size)
+            return sent
+        finally:
+            os.unlink(path)
+
+    def _cache_source(self, source_key: str, cached: tuple):
+        self._by_source[source_key] = cached
+        self._by_source.move_to_end(source_key)
+        while len(self._by_source) > SOURCE_CACHE_SIZE:
+            self._by_source.popitem(last=False)
+
+    async def _send_cached(self, bot: Bot, chat_id: int, attachment: Attachment, cached: tuple, **kwargs):
+        """Отправляет по запомненному file_id. None — Telegram его отклонил, файл нужно загрузить заново."""
+        kind, file_id = cached
+        try:
+            sent = await send_telegram_media(bot, chat_id, kind, file_id, **kwargs)
+        except TelegramBadRequest as e:
+            logger.warning("Telegram отклонил file_id вложения %s, загружаем заново: %s", attachment.source_key, e)
+            await self._discard(file_id)
+            return None
+        self._cache_source(attachment.source_key, cached)
+        return sent
+
+    async def _download(self, url: str) -> Optional[tuple]:
+        """
+        Скачивает файл по частям во временный файл, считая sha256 на лету.
+        Возвращает (путь, хэш, размер) или None при ошибке и превышении предела.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        handle = tempfile.NamedTemporaryFile(dir=self.tmp_dir, prefix="avito-media-", delete=False)
+        try:
+            with handle:
+                async with avito_client.request("GET", url, operation="download_media", limited=False) as response:
+                    response.raise_for_status()
+                    if (response.content_length or 0) > self.max_bytes:
+                        logger.warning("Вложение %s больше %s байт, отправляем ссылку", url, self.max_bytes)
+                        raise _TooLarge()
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            logger.warning("Вложение %s больше %s байт, отправляем ссылку", url, self.max_bytes)
+                            raise _TooLarge()
+                        digest.update(chunk)
+                        handle.write(chunk)
+            return handle.name, digest.hexdigest(), size
+        except Exception as e:
+            if not isinstance(e, _TooLarge):
+                logger.error("Ошибка скачивания вложения %s: %s", url, e)
+            os.unlink(handle.name)
+            return None
+
+    async def _lookup(self, condition) -> Optional[tuple]:
+        async with async_session() as session:
+            row = await session.execute(select(MediaFile.kind, MediaFile.file_id).where(condition).limit(1))
+            row = row.first()
+        return tuple(row) if row else None
+
+    async def _discard(self, file_id: str):
+        """Забывает file_id: иначе поиск по адресу и по хэшу снова вернул бы его."""
+        for source_key in [key for key, (_, cached_id) in self._by_source.items() if cached_id == file_id]:
+            del self._by_source[source_key]
+        try:
+            async with async_session() as session:
+                await session.execute(delete(MediaFile).where(MediaFile.file_id == file_id))
+                await session.commit()
+        except Exception as e:
+            logger.error("Не удалось удалить отклоненный file_id вложения: %s", e)
+
+    async def _remember(self, source_key: str, content_hash: str, kind: str, file_id: str, size: int):
+        self._cache_source(source_key, (kind, file_id))
+        try:
+            async with async_session() as session:
+                await session.execute(insert_ignore_conflicts(
+                    MediaFile,
+                    [{
+                        "content_hash": content_hash,
+                        "source_key": source_key,
+                        "kind": kind,
+                        "file_id": file_id,
+                        "size": size,
+                    }],
+                    ["content_hash"],
+                ))
+                await session.commit()
+        except Exception as e:
+            logger.error("Не удалось сохранить file_id вложения: %s", e)
+
+
+def _file_id(message, kind: str) -> Optional[str]:
+    if kind == "photo" and getattr(message, "photo", None):
+        return message.photo[-1].file_id
+    document = getattr(message, "document", None)
+    return document.file_id if document else None
+
+
+media_forwarder = MediaForwarder()
@@ -1,239 +1,533 @@
 import asyncio
+import time
+from collections import deque
+from typing import Optional
 from aiogram import Bot
-from sqlalchemy import select
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import lambda_stmt, select
 from src.models.message_link import MessageLink
+from src.models.forwarded_message import ForwardedMessage
 from src.models.user import User
-from src.services.avito_api import get_access_token, get_chats, get_messages_from_chat, get_self_info, mark_chat_as_read, send_message
-from src.database.db import async_session
+from src.services.cursor_service import get_chat_cursors, chat_marker_moved, save_chat_cursors
+from src.services.token_manager import get_access_token, token_manager
+from src.services.telegram_api import send_telegram_message
+from src.services.routing_cache import ReplyRoute, routing_cache
+from src.services.dedup_service import filter_unseen, recently_seen
+from src.services.media_service import extract_attachment, media_forwarder
+from src.services.avito_models import Message
+from src.services.chat_service import ChatInfo, UNKNOWN_SENDER, chat_directory
+from src.services.circuit_breaker import AUTH, circuit_breakers
+from src.services.diagnostics import PhaseTimer, diagnostics
+from src.services import metrics
+from src.services.avito_api import (
+    AvitoAPIError, get_chats, get_messages_from_chat, mark_chat_as_read, send_message
+)
+from src.database.db import async_session, insert_ignore_conflicts
 from datetime import datetime
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from config import POLL_CONCURRENCY, CHAT_FETCH_CONCURRENCY, DIGEST_MAX_MESSAGES, DIGEST_MAX_LENGTH, LOG_THROTTLE
 import logging
 
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def fetch_and_send_messages(bot: Bot, access_token: str, avito_user_id: str, telegram_chat_id: int):
-    logger.info(f"Начинаем обработку сообщений для Avito ID: {avito_user_id}")
-    
-    try:
-        self_info = await get_self_info(access_token)
-        if not self_info or "id" not in self_info:
-            logger.error("Не удалось получить информацию о пользователе Avito, возможно, токен недействителен")
-            return
+_MEDIA_LABELS = {"photo": "📷 Фото", "voice": "🎤 Голосовое сообщение", "file": "📎 Файл"}
 
-        chats_response = await get_chats(access_token, avito_user_id, unread_only=True)
-        if not chats_response or "chats" not in chats_response:
-            logger.info("Нет новых чатов с сообщениями или ошибка запроса")
-            return
 
-        for chat in chats_response["chats"]:
-            chat_id = chat["id"]
-            messages_response = await get_messages_from_chat(access_token, avito_user_id, chat_id)
-            if not messages_response or "messages" not in messages_response:
-                continue
+def _message_text(message: Message) -> str:
+    content = message.content
+    return (
+        content.get("text")
+        or (content.get("link") or {}).get("url")
+        or (content.get("item") or {}).get("title")
+        or (content.get("location") or {}).get("text")
+        or "[сообщение без текста]"
+    )
 
-            last_unread_message = next(
-                (msg for msg in reversed(messages_response["messages"]) if not msg["isRead"]),
-                None
-            )
-            if not last_unread_message:
-                continue
 
-            logger.debug(f"Последнее непрочитанное сообщение: {last_unread_message}")
-            logger.debug(f"Пользователи чата: {chat['users']}")
+def _message_sender(message: Message, info: Optional[ChatInfo], avito_user_id: str) -> str:
+    if message.author_id:
+        return message.author_id
+    # Если автор не указан, считаем отправителем собеседника
+    if info is not None and info.counterpart_id:
+        return info.counterpart_id
+    return str(avito_user_id)  # Если собеседник не найден, считаем системным или своим
+
+
+def _sender_name(info: Optional[ChatInfo], sender_id: str, avito_user_id: str) -> str:
+    if sender_id == str(avito_user_id):
+        return "Вы"
+    if info is not None and info.counterpart_id == sender_id:
+        return info.counterpart_name
+    return UNKNOWN_SENDER
+
+
+def _chat_footer(info: Optional[ChatInfo]) -> str:
+    lines = []
+    if info is not None and info.item_title:
+        item = f"[{info.item_title}]({info.item_url})" if info.item_url else info.item_title
+        lines.append(f"📦 Объявление: {item}")
+    profile_url = info.profile_url if info is not None else ""
+    lines.append(f"👉 Перейдите [по ссылке]({profile_url}) к профилю отправителя")
+    return "\n".join(lines)
+
+
+def _format_message(sender_name: str, message: Message, info: Optional[ChatInfo]) -> str:
+    created_time = datetime.fromtimestamp(message.created)
+    return (
+        f"📨 *Новое сообщение от {sender_name}*\n\n"
+        f"💬 Текст: _{_message_text(message)}_\n\n"
+        f"🕒 Время: {created_time.strftime('%d.%m.%Y %H:%M')}\n"
+        f"{_chat_footer(info)}"
+    )
 
-            # Определяем отправителя
-            if "author" in last_unread_message and "id" in last_unread_message["author"]:
-                sender_id = last_unread_message["author"]["id"]
-            else:
-                # Если 'author' отсутствует, определяем отправителя из chat["users"]
-                sender_id = next(
-                    (user["id"] for user in chat["users"] if user["id"] != avito_user_id),
-                    avito_user_id  # Если собеседник не найден, считаем системным или своим
-                )
 
-            sender_name = next(
-                (user["name"] for user in chat["users"] if user["id"] == sender_id),
-                "Неизвестный отправитель" if sender_id != avito_user_id else "Вы"
-            )
+def _format_digest(sender_name: str, messages: list, info: Optional[ChatInfo]) -> str:
+    lines = [f"📨 *Новые сообщения от {sender_name}* ({len(messages)})\n"]
+    for message in messages:
+        created_time = datetime.fromtimestamp(message.created)
+        lines.append(f"🕒 {created_time.strftime('%d.%m %H:%M')} — _{_message_text(message)}_")
+    lines.append(f"\n{_chat_footer(info)}")
+    return "\n".join(lines)
 
-            message_id = last_unread_message["id"]
-            message_text = last_unread_message["content"]["text"]
-            created_time = datetime.fromtimestamp(last_unread_message["created"])
 
-            formatted_message = (
-                f"📨 *Новое сообщение от {sender_name}*\n\n"
-                f"💬 Текст: _{message_text}_\n\n"
-                f"🕒 Время: {created_time.strftime('%d.%m.%Y %H:%M')}\n"
-                f"👉 Перейдите [по ссылке]({chat['users'][0]['public_user_profile']['url']}) к профилю отправителя"  # Новый формат ссылки
-            )
+def _format_media_caption(sender_name: str, attachment, message: Message, info: Optional[ChatInfo]) -> str:
+    created_time = datetime.fromtimestamp(message.created)
+    return (
+        f"{_MEDIA_LABELS[attachment.kind]} *от {sender_name}*\n"
+        f"🕒 Время: {created_time.strftime('%d.%m.%Y %H:%M')}\n"
+        f"{_chat_footer(info)}"
+    )
 
-            sent_message = await bot.send_message(
-                chat_id=telegram_chat_id,
-                text=formatted_message,
-                parse_mode="Markdown"
-            )
 
-            async with async_session() as session:
-                user = await session.execute(
-                    select(User).where(User.telegram_chat_id == telegram_chat_id)
+def _format_media_link(sender_name: str, attachment, message: Message, info: Optional[ChatInfo]) -> str:
+    """Текст вместо вложения, которое не удалось переслать файлом (слишком большое или недоступное)."""
+    caption = _format_media_caption(sender_name, attachment, message, info)
+    if attachment.url:
+        return f"{caption}\n📥 [Открыть вложение]({attachment.url})"
+    return caption
+
+
+def _split_burst(messages: list) -> list:
+    """
+    Делит пачку сообщений чата на дайджесты по количеству и длине текста.
+    Вложения идут отдельными группами из одного сообщения, порядок сообщений сохраняется.
+    """
+    batches = [[]]
+    length = 0
+    for message in messages:
+        if extract_attachment(message):
+            batches.append([message])
+            batches.append([])
+            length = 0
+            continue
+        size = len(_message_text(message)) + 20
+        batch = batches[-1]
+        if batch and (len(batch) >= DIGEST_MAX_MESSAGES or length + size > DIGEST_MAX_LENGTH):
+            batch = []
+            batches.append(batch)
+            length = 0
+        batch.append(message)
+        length += size
+    return [batch for batch in batches if batch]
+
+
+async def _collect_unread(access_token: str, avito_user_id: str, chat_id: str, cursor) -> list:
+    """
+    Собирает непрочитанные входящие сообщения чата в хронологическом порядке.
+    Сообщения идут от новых к старым, поэтому обход останавливается на курсоре чата,
+    первом прочитанном или уже пересланном сообщении — более старые обработаны раньше.
+    """
+    unread = []
+    async for msg in get_messages_from_chat(access_token, avito_user_id, chat_id):
+        if cursor is not None and msg.id == cursor.last_message_id:
+            break
+        if msg.direction == "out":
+            continue
+        if msg.is_read or msg.id in recently_seen:
+            break
+        unread.append(msg)
+    unread.sort(key=lambda msg: msg.created)
+    return unread
+
+
+async def _fetch_unread(access_token: str, avito_user_id: str, chat_id: str, cursor) -> Optional[list]:
+    """
+    Стадия чтения конвейера: новые сообщения чата без уже пересланных.
+    None — непрочитанных нет; пустой список — все уже пересланы, но чат нужно отметить прочитанным.
+    """
+    unread = await _collect_unread(access_token, avito_user_id, chat_id, cursor)
+    if not unread:
+        return None
+    # Уже пересланные не повторяем, но чат все равно отмечаем прочитанным
+    async with async_session() as session:
+        unseen = set(await filter_unseen(session, [msg.id for msg in unread]))
+    return [msg for msg in unread if msg.id in unseen]
+
+
+async def _forward_unread(
+    bot: Bot, access_token: str, avito_user_id: str, telegram_chat_id: int, user_pk: int,
+    chat_id: str, info: Optional[ChatInfo], unread: list, timer: PhaseTimer, new_links: list, forwarded: list,
+):
+    """Стадия отправки конвейера: сообщения одного чата уходят в Telegram по порядку."""
+    for batch in _split_burst(unread):
+        last_message = batch[-1]
+        sender_id = _message_sender(last_message, info, avito_user_id)
+        sender_name = _sender_name(info, sender_id, avito_user_id)
+        logger.debug("Пересылка %s сообщений чата %s от %s", len(batch), chat_id, sender_name)
+
+        attachment = extract_attachment(last_message) if len(batch) == 1 else None
+        sent_message = None
+        with timer.phase("telegram"):
+            if attachment:
+                sent_message = await media_forwarder.forward(
+                    bot, telegram_chat_id, attachment, access_token, avito_user_id,
+                    caption=_format_media_caption(sender_name, attachment, last_message, info),
+                    parse_mode="Markdown",
                 )
-                user = user.scalar_one_or_none()
-                if user:
-                    new_link = MessageLink(
-                        telegram_message_id=sent_message.message_id,
-                        avito_chat_id=chat_id,
-                        avito_user_id=sender_id,
-                        user_id=user.id,
-                        avito_message_id=message_id
-                    )
-                    session.add(new_link)
-                    await session.commit()
-
-            await mark_chat_as_read(access_token, avito_user_id, chat_id)
+                text = _format_media_link(sender_name, attachment, last_message, info)
+            elif len(batch) == 1:
+                text = _format_message(sender_name, last_message, info)
+            else:
+                text = _format_digest(sender_name, batch, info)
+            if sent_message is None:
+                sent_message = await send_telegram_message(bot, telegram_chat_id, text, parse_mode="Markdown")
+        now = time.time()
+        for message in batch:
+            metrics.FORWARD_DELAY_SECONDS.observe(now - message.created)
+
+        # Связи пишутся одной пачкой в конце прохода; ответ на дайджест уходит в его чат
+        new_links.append({
+            "telegram_chat_id": telegram_chat_id,
+            "telegram_message_id": sent_message.message_id,
+            "avito_chat_id": chat_id,
+            "avito_user_id": sender_id,
+            "user_id": user_pk,
+            "avito_message_id": last_message.id,
+        })
+        for message in batch:
+            forwarded.append({
+                "avito_message_id": message.id,
+                "avito_chat_id": chat_id,
+                "user_id": user_pk,
+                "telegram_message_id": sent_message.message_id,
+            })
+            recently_seen.add(message.id)
+
+
+async def fetch_and_send_messages(
+    bot: Bot, access_token: str, avito_user_id: str, telegram_chat_id: int, user_pk: int,
+    timer: PhaseTimer = None, concurrency: int = CHAT_FETCH_CONCURRENCY,
+) -> int:
+    """
+    Пересылает все новые сообщения аккаунта в Telegram.
+    Несколько новых сообщений одного чата уходят одним дайджестом; уже пересланные
+    (по памяти и таблице forwarded_messages) не повторяются, даже если отметка о прочтении не прошла.
+    Работа устроена конвейером: сообщения до concurrency чатов читаются одновременно,
+    отправка в Telegram идет по чатам в порядке списка, отметки о прочтении — параллельно
+    после записи связей. Токен проверяется кэшем токенов вызывающего, без отдельного запроса.
+    user_pk — первичный ключ User, к которому привязываются MessageLink.
+    timer — разбивка времени по этапам опроса (токен, чаты, сообщения, Telegram, база, прочтение).
+    Возвращает количество чатов с новой активностью (используется планировщиком опроса).
+    """
+    logger.debug("Начинаем обработку сообщений для Avito ID: %s", avito_user_id)
+    timer = timer or PhaseTimer()
+
+    processed_chats = []
+    read_pending = []
+    new_links = []
+    forwarded = []
+    cursors = {}
+    window = deque()  # (чат, данные чата, задача чтения) в порядке списка чатов
+
+    async def send_next():
+        chat, info, task = window.popleft()
+        try:
+            # В этап messages попадает только ожидание чтения, не перекрытое отправкой предыдущих чатов
+            with timer.phase("messages"):
+                unread = await task
+        except AvitoAPIError as e:
+            # Курсор чата не сдвигаем, чтобы повторить на следующем опросе
+            logger.error("Не удалось получить сообщения чата %s: %s", chat.id, e)
+            return
+        if unread is None:
+            processed_chats.append(chat)
+            return
+        await _forward_unread(
+            bot, access_token, avito_user_id, telegram_chat_id, user_pk,
+            chat.id, info, unread, timer, new_links, forwarded,
+        )
+        read_pending.append(chat)
+
+    try:
+        with timer.phase("db"):
+            async with async_session() as session:
+                cursors = await get_chat_cursors(session, avito_user_id)
+
+        # Чаты и сообщения читаются постранично по мере обработки
+        async for chat in timer.iterate("chats", get_chats(access_token, avito_user_id, unread_only=True)):
+            # Сообщения запрашиваем только для чатов, где маркер last_message сдвинулся
+            cursor = cursors.get(chat.id)
+            if not chat_marker_moved(cursor, chat):
+                continue
+
+            # Собеседник и объявление: из списка чатов, а если там их нет — из кэша, базы или API
+            info = chat_directory.observe(avito_user_id, chat)
+            if info is None:
+                with timer.phase("chats"):
+                    info = await chat_directory.resolve(avito_user_id, chat.id, access_token)
 
+            task = asyncio.create_task(_fetch_unread(access_token, avito_user_id, chat.id, cursor))
+            window.append((chat, info, task))
+            if len(window) >= concurrency:
+                await send_next()
+
+        while window:
+            await send_next()
+
+        processed_chats.extend(read_pending)
     except Exception as e:
-        logger.error(f"Критическая ошибка: {str(e)}")
+        logger.error("Критическая ошибка: %s", e)
         raise
+    finally:
+        # Чтения, оставшиеся после ошибки, отменяем и дожидаемся, чтобы их исключения не потерялись
+        pending = [task for _, _, task in window]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        # Связи, пересланные сообщения и курсоры сохраняем одной транзакцией, даже если цикл прервался
+        with timer.phase("db"):
+            if processed_chats or new_links:
+                inserted = []
+                async with async_session() as session:
+                    if new_links:
+                        # В кэш маршрутов попадают только действительно вставленные связи
+                        inserted = await session.execute(
+                            insert_ignore_conflicts(MessageLink, new_links, ["telegram_chat_id", "telegram_message_id"])
+                            .returning(MessageLink.telegram_message_id, MessageLink.avito_chat_id)
+                        )
+                        inserted = inserted.all()
+                    if forwarded:
+                        await session.execute(
+                            insert_ignore_conflicts(ForwardedMessage, forwarded, ["avito_message_id"])
+                        )
+                    await save_chat_cursors(session, avito_user_id, processed_chats)
+                for telegram_message_id, avito_chat_id in inserted:
+                    routing_cache.put_message(telegram_chat_id, telegram_message_id, avito_chat_id, user_pk)
+            await chat_directory.flush()
+
+    # Отметки о прочтении — после обхода (иначе список unread_only сдвигается под offset
+    # следующих страниц) и после записи связей, чтобы прочитанное в Avito не осталось без связи
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def mark_read(chat):
+        async with semaphore:
+            await mark_chat_as_read(access_token, avito_user_id, chat.id)
+
+    with timer.phase("mark_read"):
+        await asyncio.gather(*(mark_read(chat) for chat in read_pending))
+
+    return len(processed_chats)
+
+
+def _reply_route_stmt(telegram_chat_id: int, telegram_message_id: int):
+    # lambda_stmt кэширует построение и компиляцию выражения между вызовами
+    return lambda_stmt(
+        lambda: select(
+            MessageLink.avito_chat_id, User.id, User.avito_user_id, User.client_id, User.client_secret,
+            User.telegram_chat_id,
+        )
+        .join(User, User.id == MessageLink.user_id)
+        .where(
+            MessageLink.telegram_chat_id == telegram_chat_id,
+            MessageLink.telegram_message_id == telegram_message_id,
+        )
+    )
 
 
-async def send_message_to_avito(telegram_message_id: int, reply_text: str):
+async def get_reply_route(telegram_chat_id: int, telegram_message_id: int) -> Optional[ReplyRoute]:
+    """
+    Находит чат Avito и аккаунт для ответа на сообщение telegram_message_id в чате telegram_chat_id:
+    сначала в кэше маршрутов, при промахе — одним запросом к базе.
+    Маршрут аккаунта, привязанного к другому чату Telegram, не возвращается: ответ ушел бы
+    от имени чужого продавца.
+    """
+    route = routing_cache.get(telegram_chat_id, telegram_message_id)
+    if route is None:
+        async with async_session() as session:
+            row = await session.execute(_reply_route_stmt(telegram_chat_id, telegram_message_id))
+            row = row.first()
+        if row is None:
+            return None
+        route = ReplyRoute(*row)
+        routing_cache.put_message(telegram_chat_id, telegram_message_id, route.avito_chat_id, route.user_pk)
+        routing_cache.set_account(
+            route.user_pk, route.avito_user_id, route.client_id, route.client_secret, route.telegram_chat_id
+        )
+
+    if route.telegram_chat_id != telegram_chat_id:
+        logger.warning(
+            "Сообщение %s чата %s принадлежит аккаунту другого чата, ответ не отправлен",
+            telegram_message_id, telegram_chat_id,
+        )
+        return None
+    return route
+
+
+async def send_message_to_avito(telegram_chat_id: int, telegram_message_id: int, reply_text: str):
     """Единственная функция для отправки сообщений в Avito"""
-    async with async_session() as session:
-        try:
-            # Шаг 1: Получаем связь сообщения
-            message_link = await session.execute(
-                select(MessageLink).where(
-                    MessageLink.telegram_message_id == telegram_message_id
-                )
-            )
-            message_link = message_link.scalar_one_or_none()
-
-            if not message_link:
-                logger.error(f"MessageLink не найден для ID: {telegram_message_id}")
-                return None
+    started = time.perf_counter()
+    try:
+        # Шаг 1: Находим чат и аккаунт
+        route = await get_reply_route(telegram_chat_id, telegram_message_id)
+        if not route:
+            logger.error("MessageLink не найден для ID: %s", telegram_message_id)
+            return None
 
-            # Шаг 2: Получаем пользователя
-            user = await session.get(User, message_link.user_id)
-            if not user:
-                logger.error(f"Пользователь не найден: ID {message_link.user_id}")
-                return None
+        # Шаг 2: Получаем токен
+        access_token = await get_access_token(route.client_id, route.client_secret)
+        if not access_token:
+            logger.error("Ошибка получения access_token")
+            return None
 
-            # Шаг 3: Получаем токен
-            access_token = await get_access_token(user.client_id, user.client_secret)
-            if not access_token:
-                logger.error("Ошибка получения access_token")
-                return None
-
-            # Шаг 4: Отправляем сообщение
-            logger.debug(
-                f"Отправка в чат {message_link.avito_chat_id}, "
-                f"Avito ID: {user.avito_user_id}, "
-                f"Текст: {reply_text}"
-            )
+        # Шаг 3: Отправляем сообщение
+        logger.debug(
+            "Отправка в чат %s, Avito ID: %s, Текст: %s", route.avito_chat_id, route.avito_user_id, reply_text
+        )
+
+        response = await send_message(
+            access_token=access_token,
+            avito_user_id=route.avito_user_id,
+            avito_chat_id=route.avito_chat_id,
+            message_text=reply_text
+        )
+
+        # Исправленная проверка ответа
+        if response and isinstance(response, dict) and response.get("id"):
+            logger.info("Успешно отправлено: %s", response['id'])
+            metrics.REPLY_SECONDS.observe(time.perf_counter() - started, "direct")
+            return response
+        
+        logger.error("Некорректный ответ: %s", response)
+        return None
 
-            response = await send_message(
-                access_token=access_token,
-                avito_user_id=user.avito_user_id,
-                avito_chat_id=message_link.avito_chat_id,
-                message_text=reply_text
+    except Exception as e:
+        logger.error("Ошибка: %s", e, exc_info=True)
+        return None
+
+
+# Опросы одного аккаунта идут по очереди, кто бы их ни запустил
+_account_locks = {}  # id пользователя -> asyncio.Lock
+
+
+async def poll_account(bot: Bot, user: User) -> tuple:
+    """
+    Проверяет сообщения одного аккаунта. Ошибки не выходят наружу,
+    чтобы сбой одного аккаунта не влиял на остальные.
+    Параллельный опрос того же аккаунта ждет завершения текущего: иначе оба прохода
+    переслали бы одни и те же сообщения.
+    Возвращает пару (итог, число активных чатов), где итог — "ok", "skipped", "quarantined" или "failed".
+    """
+    lock = _account_locks.setdefault(user.id, asyncio.Lock())
+    async with lock:
+        started = time.perf_counter()
+        result = await _poll_account(bot, user)
+        metrics.ACCOUNT_POLL_SECONDS.observe(time.perf_counter() - started, result[0])
+    diagnostics.poll_done()
+    await _notify_quarantine(bot, user)
+    return result
+
+
+async def _poll_account(bot: Bot, user: User) -> tuple:
+    logger.debug("Проверка сообщений для Telegram ID: %s, Avito ID: %s", user.user_id, user.avito_user_id)
+    try:
+        if not (user.telegram_chat_id and user.avito_user_id):
+            logger.warning(
+                "Пропущен пользователь: Telegram ID %s, нет avito_user_id или telegram_chat_id", user.user_id,
+                extra={"throttle": LOG_THROTTLE},
             )
+            return "skipped", 0
+        # Аккаунт со сбоями не опрашиваем до конца паузы выключателя
+        if circuit_breakers.quarantined(user.client_id, user.avito_user_id):
+            return "quarantined", 0
 
-            # Исправленная проверка ответа
-            if response and isinstance(response, dict) and response.get("id"):
-                # Проверка на существующую запись
-                existing = await session.execute(
-                    select(MessageLink).where(
-                        MessageLink.telegram_message_id == telegram_message_id
-                    )
-                )
-                if existing.scalar():
-                    logger.warning(f"MessageLink {telegram_message_id} уже существует")
-                    return response
-                
-                new_link = MessageLink(
-                    telegram_message_id=telegram_message_id,
-                    avito_chat_id=message_link.avito_chat_id,
-                    avito_user_id=str(user.avito_user_id),  # Приведение к строке
-                    user_id=user.id,
-                    avito_message_id=response["id"]
-                )
-                session.add(new_link)
-                
-                try:
-                    await session.commit()
-                except IntegrityError:
-                    await session.rollback()
-                    logger.warning("Обнаружен дубликат, откат транзакции")
-                    return response
-
-                logger.info(f"Успешно сохранено: {response['id']}")
-                return response
-            
-            logger.error(f"Некорректный ответ: {response}")
-            return None
+        timer = PhaseTimer()
+        with timer.phase("token"):
+            access_token = await get_access_token(user.client_id, user.client_secret)
+        if not access_token:
+            return "failed", 0
+        # Данные аккаунта для маршрутизации ответов без обращения к базе
+        routing_cache.set_account(
+            user.id, user.avito_user_id, user.client_id, user.client_secret, user.telegram_chat_id
+        )
+        active_chats = await fetch_and_send_messages(
+            bot, access_token, user.avito_user_id, user.telegram_chat_id, user.id, timer
+        )
+        timer.observe()
+        logger.debug("Опрос Avito ID %s по этапам, с: %s", user.avito_user_id, timer)
+        return "ok", active_chats
+    except AvitoAPIError as e:
+        if e.status in (401, 403):
+            # Токен из кэша отозван или истек раньше срока — следующий опрос запросит новый
+            token_manager.forget(user.client_id)
+        logger.error("Ошибка при проверке сообщений Telegram ID %s: %s", user.user_id, e)
+        return "failed", 0
+    except Exception as e:
+        logger.error("Ошибка при проверке сообщений Telegram ID %s: %s", user.user_id, e)
+        return "failed", 0
+
+
+async def _notify_quarantine(bot: Bot, user: User):
+    """Один раз сообщает пользователю, что проверка его аккаунта приостановлена."""
+    kind = circuit_breakers.take_notice(user.client_id, user.avito_user_id)
+    if kind is None or not user.telegram_chat_id:
+        return
+    if kind == AUTH:
+        text = (
+            "⚠️ Avito не принимает client_id и client_secret вашего аккаунта, проверка сообщений приостановлена.\n"
+            "Введите актуальные данные командой /register."
+        )
+    else:
+        text = (
+            "⚠️ API Avito не отвечает для вашего аккаунта, проверка сообщений приостановлена.\n"
+            "Она возобновится автоматически, когда Avito снова станет доступен."
+        )
+    try:
+        await send_telegram_message(bot, user.telegram_chat_id, text)
+    except Exception as e:
+        logger.error("Не удалось уведомить Telegram ID %s о карантине: %s", user.user_id, e)
 
-        except Exception as e:
-            logger.error(f"Ошибка: {str(e)}", exc_info=True)
-            return None            
 
+async def check_user_messages(bot: Bot, user: User, semaphore: asyncio.Semaphore) -> str:
+    """Проверяет аккаунт с учетом общего ограничения параллельности."""
+    async with semaphore:
+        status, _ = await poll_account(bot, user)
+        return status
 
-async def periodic_message_check(bot: Bot):
-    while True:
-        async with async_session() as session:
-            users = await session.execute(select(User))
-            users = users.scalars().all()
-
-            for user in users:
-                logger.info(f"Проверка сообщений для Telegram ID: {user.user_id}, Avito ID: {user.avito_user_id}")
-                access_token = await get_access_token(user.client_id, user.client_secret)
-                if access_token and user.telegram_chat_id and user.avito_user_id:
-                    await fetch_and_send_messages(bot, access_token, user.avito_user_id, user.telegram_chat_id)
-                else:
-                    logger.warning(f"Пропущен пользователь: Telegram ID {user.user_id}, нет avito_user_id или telegram_chat_id")
-        await asyncio.sleep(1)  # Увеличили интервал для тестов
-
-
-
-async def delete_old_messages(session: AsyncSession):
-    # Установка ограничения на количество сообщений
-    limit = 10000
-    
-    # Получение старых сообщений
-    old_messages = await session.execute(
-        select(MessageLink).order_by(MessageLink.id.asc()).limit(limit)
-    )
-    
-    # Удаление старых сообщений
-    for message in old_messages.scalars().all():
-        await session.delete(message)
-        print(f"Удалено сообщение с ID {message.id}")
-    
-    # Сохранение изменений
-    await session.commit()
-
-    # Проверка содержимого базы данных после удаления сообщений
-    messages_after_deletion = await session.execute(
-        select(MessageLink).order_by(MessageLink.id.asc())
-    )
-    
-    # Проверка, что записи, которые должны быть удалены, действительно отсутствуют в таблице
-    if messages_after_deletion.scalars().all():
-        print("Сообщения не были удалены")
-    else:
-        print("Сообщения были удалены успешно")
 
+async def run_poll_cycle(bot: Bot, concurrency: int = POLL_CONCURRENCY) -> dict:
+    """
+    Один цикл опроса всех аккаунтов с ограничением параллельности.
+    В работе бота опросом управляет PollScheduler; цикл целиком нужен бенчмаркам.
+    """
+    started = time.monotonic()
 
-async def delete_old_messages_daily():
     async with async_session() as session:
-        await delete_old_messages(session)
-        print(f"Удалены старые сообщения {datetime.now()}")
-
-def start_scheduler():
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(delete_old_messages_daily, 'cron', day='*/3', hour=0, minute=0, second=0)
-    scheduler.start()
+        users = await session.execute(select(User))
+        users = users.scalars().all()
+
+    semaphore = asyncio.Semaphore(concurrency)
+    results = await asyncio.gather(*(check_user_messages(bot, user, semaphore) for user in users))
+
+    stats = {
+        "accounts": len(users),
+        "ok": results.count("ok"),
+        "skipped": results.count("skipped"),
+        "quarantined": results.count("quarantined"),
+        "failed": results.count("failed"),
+        "duration": time.monotonic() - started,
+    }
+    logger.info(
+        "Цикл опроса завершен за %.3f с: аккаунтов %s, успешно %s, пропущено %s, на карантине %s, ошибок %s",
+        stats["duration"], stats["accounts"], stats["ok"], stats["skipped"], stats["quarantined"], stats["failed"],
+        extra={"throttle": LOG_THROTTLE},
+    )
+    return stats
@@ -0,0 +1,202 @@
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from aiohttp import web
+from config import METRICS_ENABLED, METRICS_HOST, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+# Метрики собираются только при включенном METRICS_ENABLED; иначе вызовы сразу возвращаются
+enabled = METRICS_ENABLED
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        if not enabled:
+            return
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge:
+    """Значение выставляется через set() или вычисляется при сборе функцией из set_function()."""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._function = None
+
+    def set(self, value: float, *labels):
+        if not enabled:
+            return
+        self._values[labels] = value
+
+    def set_function(self, function):
+        self._function = function
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} gauge"
+        if self._function is not None:
+            yield f"{self.name} {self._function()}"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels -> [счетчики по корзинам, сумма, количество]
+
+    def observe(self, value: float, *labels):
+        if not enabled:
+            return
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        if not enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(self.labelnames, labels, f'le="{bound}"')
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            bucket_labels = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            yield f"{self.name}_bucket{bucket_labels} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}"
+
+
+_registry = []
+
+
+def _register(metric):
+    _registry.append(metric)
+    return metric
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Метрики бота ---
+
+AVITO_REQUESTS = _register(Counter(
+    "avito_requests_total", "Запросы к API Avito", ("operation", "status")
+))
+AVITO_REQUEST_SECONDS = _register(Histogram(
+    "avito_request_seconds", "Длительность запросов к API Avito", ("operation",)
+))
+POLL_ACCOUNTS = _register(Gauge(
+    "poll_accounts", "Аккаунты, которые опрашивает планировщик этого процесса"
+))
+POLL_PERIOD_POLLS = _register(Gauge(
+    "poll_period_polls", "Опросы аккаунтов за последний период обновления списка аккаунтов", ("result",)
+))
+ACCOUNT_POLL_SECONDS = _register(Histogram(
+    "account_poll_seconds", "Длительность опроса одного аккаунта", ("status",)
+))
+FORWARD_DELAY_SECONDS = _register(Histogram(
+    "forward_delay_seconds", "Время от появления сообщения в Avito до пересылки в Telegram",
+    buckets=(0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800),
+))
+REPLY_SECONDS = _register(Histogram(
+    "reply_seconds", "Время доставки ответа из Telegram в Avito", ("path",)
+))
+TOKEN_CACHE = _register(Counter(
+    "token_cache_total", "Обращения к кэшу токенов", ("result",)
+))
+DB_SESSION_SECONDS = _register(Histogram(
+    "db_session_seconds", "Длительность сессий базы данных"
+))
+AVITO_LIMITER_QUEUE = _register(Gauge(
+    "avito_limiter_queue_depth", "Запросы Avito, ожидающие лимита"
+))
+TELEGRAM_LIMITER_QUEUE = _register(Gauge(
+    "telegram_limiter_queue_depth", "Сообщения Telegram, ожидающие лимита"
+))
+OUTBOX_QUEUE = _register(Gauge(
+    "outbox_queue_depth", "Чаты с ответами в очереди outbox"
+))
+POLL_PHASE_SECONDS = _register(Histogram(
+    "poll_phase_seconds", "Время опроса аккаунта по этапам", ("phase",)
+))
+LOOP_LAG_SECONDS = _register(Histogram(
+    "loop_lag_seconds", "Задержка цикла событий", buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+))
+CIRCUITS_BY_STATE = _register(Gauge(
+    "avito_circuits", "Незамкнутые выключатели аккаунтов Avito по классу запросов и состоянию", ("endpoint", "state")
+))
+CIRCUIT_TRANSITIONS = _register(Counter(
+    "avito_circuit_transitions_total", "Переходы выключателей аккаунтов Avito", ("endpoint", "state")
+))
+CIRCUIT_FAILURES = _register(Counter(
+    "avito_circuit_failures_total", "Сбои запросов Avito, учтенные выключателями", ("endpoint", "kind")
+))
+CIRCUITS_OPEN = _register(Gauge(
+    "avito_circuits_open", "Незамкнутые выключатели аккаунтов Avito"
+))
+
+
+async def _metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Метрики доступны на http://%s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,285 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+from aiogram import Bot
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from src.models.outbox_message import OutboxMessage
+from src.models.user import User
+from src.database.db import async_session
+from src.services.message_service import get_reply_route
+from src.services.routing_cache import routing_cache
+from src.services.token_manager import get_access_token
+from src.services.avito_api import PRIORITY_REPLY, get_messages_from_chat, send_message
+from src.services import metrics
+from config import OUTBOX_WORKERS, OUTBOX_MAX_ATTEMPTS, OUTBOX_BACKOFF_BASE, OUTBOX_BACKOFF_MAX
+
+logger = logging.getLogger(__name__)
+
+# Запас по времени при поиске уже доставленного ответа в чате Avito, секунд
+RECONCILE_CLOCK_MARGIN = 60
+
+
+class OutboxDispatcher:
+    """
+    Доставка ответов из Telegram в Avito через таблицу outbox_messages.
+    Ответ сначала сохраняется в базе, затем пул воркеров отправляет его:
+    - сообщения одного чата Avito уходят строго по порядку, в каждый чат отправляет один воркер;
+    - неудачные попытки повторяются с экспоненциальной паузой;
+    - перед повтором проверяется, не дошло ли сообщение в прошлый раз, чтобы не было дублей;
+    - недоставленное после перезапуска подхватывается при старте.
+    """
+
+    def __init__(
+        self,
+        workers: int = OUTBOX_WORKERS,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        backoff_base: float = OUTBOX_BACKOFF_BASE,
+        backoff_max: float = OUTBOX_BACKOFF_MAX,
+    ):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bot = None
+        self._queue = asyncio.Queue()
+        self._scheduled = set()  # Чаты в очереди или в обработке
+        self._dirty = set()  # Чаты, получившие новые сообщения во время обработки
+        self._tasks = []
+
+    async def start(self, bot: Bot):
+        self.bot = bot
+        await self._recover()
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _recover(self):
+        """Возвращает в очередь все недоставленные ответы, в том числе прерванные посреди отправки."""
+        async with async_session() as session:
+            # Прерванная отправка могла дойти до Avito: attempts > 0 включает сверку перед повтором
+            await session.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.status == "sending")
+                .values(status="pending", attempts=OutboxMessage.attempts + 1)
+            )
+            await session.commit()
+            chats = await session.execute(
+                select(OutboxMessage.avito_chat_id).where(OutboxMessage.status == "pending").distinct()
+            )
+            chats = chats.scalars().all()
+        for chat_id in chats:
+            self.notify(chat_id)
+        if chats:
+            logger.info("Восстановлено чатов с недоставленными ответами: %s", len(chats))
+
+    def notify(self, avito_chat_id: str):
+        if avito_chat_id in self._scheduled:
+            self._dirty.add(avito_chat_id)
+            return
+        self._scheduled.add(avito_chat_id)
+        self._queue.put_nowait(avito_chat_id)
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    async def enqueue(
+        self,
+        telegram_chat_id: int,
+        telegram_message_id: int,
+        reply_to_message_id: int,
+        text: str,
+        status_message_id: Optional[int] = None,
+    ) -> Optional[OutboxMessage]:
+        """
+        Сохраняет ответ в outbox. Возвращает None, если не найден чат Avito для ответа
+        или аккаунт сообщения привязан к другому чату Telegram.
+        Повторный вызов для того же сообщения Telegram не создает второй отправки.
+        """
+        route = await get_reply_route(telegram_chat_id, reply_to_message_id)
+        if route is None:
+            return None
+
+        row = OutboxMessage(
+            idempotency_key=f"tg:{telegram_chat_id}:{telegram_message_id}",
+            user_id=route.user_pk,
+            avito_chat_id=route.avito_chat_id,
+            reply_to_message_id=reply_to_message_id,
+            telegram_chat_id=telegram_chat_id,
+            status_message_id=status_message_id,
+            text=text,
+        )
+        async with async_session() as session:
+            session.add(row)
+            try:
+                await session.commit()
+            except IntegrityError:
+                await session.rollback()
+                logger.warning("Ответ %s уже в очереди", row.idempotency_key)
+                existing = await session.execute(
+                    select(OutboxMessage).where(OutboxMessage.idempotency_key == row.idempotency_key)
+                )
+                return existing.scalar_one()
+
+        self.notify(row.avito_chat_id)
+        return row
+
+    async def _worker(self):
+        while True:
+            avito_chat_id = await self._queue.get()
+            try:
+                await self._process_chat(avito_chat_id)
+            except Exception as e:
+                logger.error("Ошибка обработки outbox для чата %s: %s", avito_chat_id, e)
+            finally:
+                self._scheduled.discard(avito_chat_id)
+                if avito_chat_id in self._dirty:
+                    self._dirty.discard(avito_chat_id)
+                    self.notify(avito_chat_id)
+
+    def _notify_later(self, avito_chat_id: str, delay: float):
+        asyncio.get_running_loop().call_later(max(delay, 0), self.notify, avito_chat_id)
+
+    async def _process_chat(self, avito_chat_id: str):
+        """Отправляет ответы чата по порядку, пока очередь чата не опустеет или не наступит пауза."""
+        while True:
+            async with async_session() as session:
+                row = await session.execute(
+                    select(OutboxMessage)
+                    .where(OutboxMessage.avito_chat_id == avito_chat_id, OutboxMessage.status == "pending")
+                    .order_by(OutboxMessage.id)
+                    .limit(1)
+                )
+                row = row.scalar_one_or_none()
+                if row is None:
+                    return
+
+                wait = (row.next_attempt_at - datetime.utcnow()).total_seconds()
+                if wait > 0:
+                    # Следующие сообщения чата ждут вместе с этим, чтобы сохранить порядок
+                    self._notify_later(avito_chat_id, wait)
+                    return
+
+                row.status = "sending"
+                await session.commit()
+
+                try:
+                    avito_message_id, error = await self._deliver(row)
+                except Exception as e:
+                    avito_message_id, error = None, str(e)
+                if avito_message_id:
+                    row.status = "sent"
+                    row.avito_message_id = str(avito_message_id)
+                    row.last_error = None
+                    metrics.REPLY_SECONDS.observe((datetime.utcnow() - row.created_at).total_seconds(), "outbox")
+                else:
+                    row.attempts += 1
+                    row.last_error = error
+                    if row.attempts >= self.max_attempts:
+                        row.status = "failed"
+                    else:
+                        row.status = "pending"
+                        delay = min(self.backoff_base ** row.attempts, self.backoff_max)
+                        row.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+                await session.commit()
+
+            await self._report(row)
+            if row.status == "pending":
+                self._notify_later(avito_chat_id, (row.next_attempt_at - datetime.utcnow()).total_seconds())
+                return
+
+    async def _account(self, user_pk: int) -> Optional[tuple]:
+        """(avito_user_id, client_id, client_secret) аккаунта: из кэша маршрутов, при промахе — из базы."""
+        account = routing_cache.get_account(user_pk)
+        if account is not None:
+            return account[:3]
+        async with async_session() as session:
+            user = await session.get(User, user_pk)
+        if user is None or not user.avito_user_id:
+            return None
+        routing_cache.set_account(
+            user.id, user.avito_user_id, user.client_id, user.client_secret, user.telegram_chat_id
+        )
+        return user.avito_user_id, user.client_id, user.client_secret
+
+    async def _deliver(self, row: OutboxMessage) -> tuple:
+        """
+        Возвращает пару (id сообщения Avito, текст ошибки).
+        Чат и аккаунт берутся из строки outbox, зафиксированные при постановке в очередь.
+        """
+        account = await self._account(row.user_id)
+        if account is None:
+            return None, "Аккаунт Avito для ответа не найден"
+        avito_user_id, client_id, client_secret = account
+
+        access_token = await get_access_token(client_id, client_secret)
+        if not access_token:
+            return None, "Не удалось получить токен доступа"
+
+        if row.attempts > 0:
+            # Прошлая попытка могла дойти до Avito без ответа нам — проверяем, прежде чем слать снова.
+            # Если проверить не удалось, не шлем вслепую: попытка считается неудачной и повторится позже
+            try:
+                delivered_id = await self._find_delivered(access_token, avito_user_id, row)
+            except Exception as e:
+                logger.warning("Не удалось сверить доставку %s: %s", row.idempotency_key, e)
+                return None, f"Не удалось проверить, дошел ли ответ: {e}"
+            if delivered_id:
+                logger.info("Ответ %s уже доставлен ранее: %s", row.idempotency_key, delivered_id)
+                return delivered_id, None
+
+        response = await send_message(
+            access_token=access_token,
+            avito_user_id=avito_user_id,
+            avito_chat_id=row.avito_chat_id,
+            message_text=row.text
+        )
+        if response and isinstance(response, dict) and response.get("id"):
+            return response["id"], None
+        return None, "Avito не принял сообщение"
+
+    async def _find_delivered(self, access_token: str, avito_user_id: str, row: OutboxMessage) -> Optional[str]:
+        """
+        id ответа, если он уже есть в чате Avito, или None, если его там точно нет.
+        Сбой чтения чата пробрасывается: отсутствие ответа он не подтверждает.
+        """
+        # Avito отдает время в целых секундах, и его часы могут расходиться с нашими: берем запас,
+        # иначе только что доставленный ответ окажется "раньше" постановки в очередь и не найдется
+        since = (row.created_at - datetime(1970, 1, 1)).total_seconds() - RECONCILE_CLOCK_MARGIN
+        # Сообщения идут от новых к старым: дальше момента постановки в очередь не листаем
+        async for msg in get_messages_from_chat(
+            access_token, avito_user_id, row.avito_chat_id, priority=PRIORITY_REPLY
+        ):
+            if msg.created < since:
+                break
+            outgoing = msg.direction == "out" or msg.author_id == str(avito_user_id)
+            if outgoing and msg.content.get("text") == row.text:
+                return msg.id
+        return None
+
+    async def _report(self, row: OutboxMessage):
+        """Обновляет в Telegram сообщение со статусом доставки."""
+        if row.status == "sent":
+            text = "✅ Ответ успешно отправлен в Avito"
+        elif row.status == "failed":
+            text = f"❌ Не удалось отправить ответ в Avito: {row.last_error}"
+        else:
+            text = f"⏳ Повторяем отправку в Avito (попытка {row.attempts + 1} из {self.max_attempts})"
+
+        if not self.bot or not row.status_message_id:
+            return
+        try:
+            await self.bot.edit_message_text(
+                text=text, chat_id=row.telegram_chat_id, message_id=row.status_message_id
+            )
+        except Exception as e:
+            logger.warning("Не удалось обновить статус ответа %s: %s", row.idempotency_key, e)
+
+
+outbox = OutboxDispatcher()
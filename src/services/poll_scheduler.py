@@ -0,0 +1,230 @@
+import asyncio
+import heapq
+import logging
+import random
+import time
+from aiogram import Bot
+from sqlalchemy import select
+from src.models.user import User
+from src.database.db import async_session
+from src.services.message_service import poll_account
+from src.services.avito_api import avito_client
+from src.services.telegram_api import telegram_limiter
+from src.services.circuit_breaker import circuit_breakers
+from src.services import metrics
+from config import (
+    POLL_CONCURRENCY,
+    POLL_INTERVAL,
+    POLL_MAX_INTERVAL,
+    POLL_IDLE_GROWTH,
+    POLL_ERROR_MAX_INTERVAL,
+    POLL_JITTER,
+    POLL_USERS_REFRESH,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AccountPollState:
+    """Состояние опроса одного аккаунта."""
+
+    __slots__ = ("user", "interval", "errors", "in_flight", "due", "repoll")
+
+    def __init__(self, user: User, interval: float):
+        self.user = user
+        self.interval = interval
+        self.errors = 0
+        self.in_flight = False
+        self.due = None  # Время действующей записи в очереди; остальные записи аккаунта устарели
+        self.repoll = False  # Событие пришло во время опроса — повторить сразу после него
+
+
+class PollScheduler:
+    """
+    Планировщик опроса: у каждого аккаунта свое время следующей проверки
+    в очереди с приоритетом. Интервал сокращается, пока в чатах есть активность,
+    растет до предела при простое и резко увеличивается после ошибок.
+    События вебхука не опрашивают аккаунт сами, а переносят его опрос на сейчас (poll_now),
+    поэтому аккаунт никогда не опрашивается двумя проходами одновременно.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        concurrency: int = POLL_CONCURRENCY,
+        min_interval: float = POLL_INTERVAL,
+        max_interval: float = POLL_MAX_INTERVAL,
+        idle_growth: float = POLL_IDLE_GROWTH,
+        error_max_interval: float = POLL_ERROR_MAX_INTERVAL,
+        jitter: float = POLL_JITTER,
+        users_refresh: float = POLL_USERS_REFRESH,
+        account_filter=None,
+    ):
+        self.bot = bot
+        # Предикат по id пользователя: опрашивать ли аккаунт в этом процессе (аренды при шардинге)
+        self.account_filter = account_filter or (lambda user_pk: True)
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.idle_growth = idle_growth
+        self.error_max_interval = max(error_max_interval, self.max_interval)
+        self.jitter = jitter
+        self.users_refresh = users_refresh
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._heap = []  # (время следующего опроса, id пользователя)
+        self._states = {}  # id пользователя -> AccountPollState
+        self._tasks = set()
+        self._wakeup = asyncio.Event()
+        self._stats = {"polls": 0, "active": 0, "failed": 0}
+
+    def _with_jitter(self, interval: float) -> float:
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _schedule(self, user_pk: int, delay: float):
+        due = time.monotonic() + delay
+        self._states[user_pk].due = due
+        heapq.heappush(self._heap, (due, user_pk))
+        self._wakeup.set()
+
+    def poll_now(self, user_pk: int) -> bool:
+        """
+        Опрашивает аккаунт без ожидания очередного срока, например по событию вебхука.
+        Если аккаунт уже опрашивается, повторный опрос начнется сразу после текущего.
+        Возвращает False, если аккаунт не опрашивается этим процессом.
+        """
+        state = self._states.get(user_pk)
+        if state is None:
+            return False
+        if state.in_flight:
+            state.repoll = True
+        elif state.due is None or state.due > time.monotonic():
+            self._schedule(user_pk, 0)
+        return True
+
+    def next_interval(self, state: AccountPollState, status: str, active_chats: int) -> float:
+        if status == "failed":
+            state.errors += 1
+            # Экспоненциальная пауза после ошибок
+            return min(max(state.interval, self.min_interval) * 2 ** state.errors, self.error_max_interval)
+
+        if status == "quarantined":
+            # Следующий опрос — к концу паузы выключателя, тогда пройдет пробный запрос
+            retry_in = circuit_breakers.retry_in(state.user.client_id, state.user.avito_user_id)
+            return min(max(retry_in, self.min_interval), self.error_max_interval)
+
+        state.errors = 0
+        if status == "skipped":
+            state.interval = self.max_interval
+        elif active_chats:
+            state.interval = self.min_interval
+        else:
+            state.interval = min(state.interval * self.idle_growth, self.max_interval)
+        return state.interval
+
+    async def refresh_users(self):
+        """Синхронизирует список аккаунтов с базой: добавляет новых и убирает удаленных."""
+        async with async_session() as session:
+            users = await session.execute(select(User))
+            users = users.scalars().all()
+
+        seen = set()
+        for user in users:
+            if not self.account_filter(user.id):
+                continue
+            seen.add(user.id)
+            state = self._states.get(user.id)
+            if state is None:
+                self._states[user.id] = AccountPollState(user, self.min_interval)
+                # Разносим первые опросы во времени, чтобы не бить в Avito синхронно
+                self._schedule(user.id, random.uniform(0, self.min_interval))
+            else:
+                state.user = user
+
+        for user_pk in set(self._states) - seen:
+            del self._states[user_pk]
+
+        stats = self._stats
+        # Длительность каждого опроса пишет poll_account (account_poll_seconds)
+        metrics.POLL_ACCOUNTS.set(len(self._states))
+        for result, count in stats.items():
+            metrics.POLL_PERIOD_POLLS.set(count, result)
+        logger.info(
+            "Планировщик опроса: аккаунтов %s, опросов %s, с активностью %s, ошибок %s; "
+            "очередь лимитов Avito %s, Telegram %s; на карантине %s",
+            len(self._states), stats["polls"], stats["active"], stats["failed"],
+            avito_client.limiter.queue_depth(), telegram_limiter.queue_depth(), circuit_breakers.snapshot(),
+        )
+        self._stats = {"polls": 0, "active": 0, "failed": 0}
+
+    async def _load_user(self, user_pk: int):
+        async with async_session() as session:
+            return await session.get(User, user_pk)
+
+    async def _poll(self, state: AccountPollState):
+        user_pk = state.user.id
+        try:
+            # Список аккаунтов обновляется раз в users_refresh, а учетные данные и само наличие
+            # аккаунта перечитываются перед каждым опросом: после /register опрос сразу идет
+            # с новыми данными, а удаленный аккаунт больше не опрашивается
+            user = await self._load_user(user_pk)
+            if user is None:
+                if self._states.get(user_pk) is state:
+                    del self._states[user_pk]
+                return
+            state.user = user
+            status, active_chats = await poll_account(self.bot, user)
+        except Exception as e:
+            # Аккаунт должен остаться в расписании: ошибка опроса получает обычную паузу после сбоя
+            logger.error("Ошибка опроса аккаунта %s: %s", user_pk, e, exc_info=True)
+            status, active_chats = "failed", 0
+        finally:
+            self._semaphore.release()
+            state.in_flight = False
+
+        self._stats["polls"] += 1
+        if status == "failed":
+            self._stats["failed"] += 1
+        elif active_chats:
+            self._stats["active"] += 1
+
+        if self._states.get(user_pk) is state:
+            delay = self._with_jitter(self.next_interval(state, status, active_chats))
+            if state.repoll:
+                state.repoll = False
+                delay = 0
+            self._schedule(user_pk, delay)
+
+    async def run(self):
+        next_refresh = 0.0
+        while True:
+            now = time.monotonic()
+            if now >= next_refresh:
+                try:
+                    await self.refresh_users()
+                except Exception as e:
+                    logger.error("Ошибка обновления списка аккаунтов: %s", e)
+                next_refresh = time.monotonic() + self.users_refresh
+                continue
+
+            if not self._heap or self._heap[0][0] > now:
+                wake_at = min(self._heap[0][0], next_refresh) if self._heap else next_refresh
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(wake_at - now, 0))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            due, user_pk = heapq.heappop(self._heap)
+            state = self._states.get(user_pk)
+            if state is None or state.in_flight or due != state.due:
+                continue
+            if not self.account_filter(user_pk):
+                # Аккаунт передан другому процессу
+                del self._states[user_pk]
+                continue
+
+            await self._semaphore.acquire()
+            state.in_flight = True
+            task = asyncio.create_task(self._poll(state))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
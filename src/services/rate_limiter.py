@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних выдач учитывается при проверке минимальных долей приоритетов
+SHARE_WINDOW = 50
+
+
+class TokenBucket:
+    """
+    Ограничитель по алгоритму token bucket. Ожидающие вызовы обслуживаются
+    в порядке приоритета (меньше — важнее), внутри приоритета — по очереди;
+    их количество доступно в waiting.
+    shares — минимальные доли выдач для фоновых приоритетов: приоритет, получивший
+    меньше своей доли среди последних выдач, обслуживается вне очереди и не голодает.
+    Нулевая или отрицательная скорость отключает ограничение.
+    """
+
+    def __init__(self, rate: float, capacity: float = None, shares: dict = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.shares = shares or {}
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._queues = {}  # приоритет -> deque ожидающих future
+        self._recent = deque(maxlen=SHARE_WINDOW)  # приоритеты последних выдач
+        self._pump_task = None
+        self.waiting = 0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, priority: int = 0):
+        if self.rate <= 0 and self._blocked_until <= time.monotonic():
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(priority, deque()).append(future)
+        self.waiting += 1
+        try:
+            if self._pump_task is None:
+                self._pump_task = asyncio.create_task(self._pump())
+            await future
+        finally:
+            self.waiting -= 1
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        """Выбирает, кому отдать токен: недобравшему долю фоновому приоритету, иначе самому важному."""
+        ready = []
+        for priority, queue in self._queues.items():
+            while queue and queue[0].done():
+                queue.popleft()  # Отмененные ожидания
+            if queue:
+                ready.append(priority)
+        if not ready:
+            return None
+        ready.sort()
+        chosen = ready[0]
+        for priority in ready[1:]:
+            share = self.shares.get(priority)
+            if share and self._recent.count(priority) < share * len(self._recent):
+                chosen = priority
+                break
+        self._recent.append(chosen)
+        return self._queues[chosen].popleft()
+
+    async def _pump(self):
+        """Выдает токены ожидающим, пока очередь не опустеет."""
+        try:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                if self.rate > 0:
+                    self._refill(now)
+                    if self._tokens < 1:
+                        await asyncio.sleep((1 - self._tokens) / self.rate)
+                        continue
+                future = self._next_waiter()
+                if future is None:
+                    return
+                if self.rate > 0:
+                    self._tokens -= 1
+                future.set_result(None)
+        finally:
+            self._pump_task = None
+
+    def penalize(self, delay: float):
+        """Приостанавливает выдачу на delay секунд (например, по Retry-After)."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        self._tokens = 0
+        self._updated = time.monotonic()
+
+
+class KeyedRateLimiter:
+    """
+    Общий лимит плюс отдельный лимит на каждый ключ (аккаунт, чат).
+    Сначала ожидается лимит ключа, затем общий, чтобы не занимать общую емкость впустую.
+    Приоритет и минимальные доли (shares) действуют на обоих уровнях.
+    """
+
+    def __init__(self, global_rate: float, key_rate: float, key_capacity: float = None, shares: dict = None):
+        self.shares = shares
+        self.global_bucket = TokenBucket(global_rate, shares=shares)
+        self.key_rate = key_rate
+        self.key_capacity = key_capacity
+        self._buckets = {}
+
+    def bucket(self, key) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.key_rate, self.key_capacity, self.shares)
+        return bucket
+
+    async def acquire(self, key=None, priority: int = 0):
+        if key is not None:
+            await self.bucket(key).acquire(priority)
+        await self.global_bucket.acquire(priority)
+
+    def penalize(self, key, delay: float):
+        if key is None:
+            self.global_bucket.penalize(delay)
+        else:
+            self.bucket(key).penalize(delay)
+
+    def forget(self, key):
+        self._buckets.pop(key, None)
+
+    def queue_depth(self, key=None) -> int:
+        """Количество ожидающих вызовов: всего или по одному ключу."""
+        if key is not None:
+            bucket = self._buckets.get(key)
+            return bucket.waiting if bucket else 0
+        return self.global_bucket.waiting + sum(bucket.waiting for bucket in self._buckets.values())
+
+
+def parse_retry_after(value, default: float = 1.0) -> float:
+    """Разбирает заголовок Retry-After: число секунд или HTTP-дата."""
+    if not value:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.models.message_link import MessageLink
+from src.models.forwarded_message import ForwardedMessage
+from src.models.outbox_message import OutboxMessage
+from src.database.db import async_session, engine
+from src.services.lease_service import lease_manager
+from config import (
+    RETENTION_MAX_AGE_DAYS,
+    RETENTION_MAX_LINKS_PER_USER,
+    RETENTION_CHUNK_SIZE,
+    RETENTION_INCREMENTAL_VACUUM,
+    RETENTION_VACUUM_PAGES,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def _delete_in_chunks(session: AsyncSession, ids_query, chunk_size: int, model=MessageLink) -> int:
+    """
+    Удаляет строки пачками: DELETE ... WHERE id IN (подзапрос с LIMIT).
+    Между пачками фиксирует транзакцию и отдает управление циклу событий,
+    чтобы не держать блокировку записи SQLite надолго.
+    """
+    total = 0
+    while True:
+        result = await session.execute(
+            delete(model)
+            .where(model.id.in_(ids_query.limit(chunk_size)))
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        total += result.rowcount
+        if result.rowcount < chunk_size:
+            return total
+        await asyncio.sleep(0)
+
+
+async def delete_expired_links(
+    session: AsyncSession, max_age_days: int = RETENTION_MAX_AGE_DAYS, chunk_size: int = RETENTION_CHUNK_SIZE
+) -> int:
+    """Удаляет связи старше max_age_days дней."""
+    if max_age_days <= 0:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+    ids_query = select(MessageLink.id).where(MessageLink.created_at < cutoff)
+    return await _delete_in_chunks(session, ids_query, chunk_size)
+
+
+async def delete_expired_forwarded(
+    session: AsyncSession, max_age_days: int = RETENTION_MAX_AGE_DAYS, chunk_size: int = RETENTION_CHUNK_SIZE
+) -> int:
+    """Удаляет отметки о пересылке старше max_age_days дней."""
+    if max_age_days <= 0:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+    ids_query = select(ForwardedMessage.id).where(ForwardedMessage.created_at < cutoff)
+    return await _delete_in_chunks(session, ids_query, chunk_size, ForwardedMessage)
+
+
+async def delete_finished_outbox(
+    session: AsyncSession, max_age_days: int = RETENTION_MAX_AGE_DAYS, chunk_size: int = RETENTION_CHUNK_SIZE
+) -> int:
+    """Удаляет отправленные и окончательно не отправленные ответы старше max_age_days дней."""
+    if max_age_days <= 0:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+    ids_query = select(OutboxMessage.id).where(
+        OutboxMessage.status.in_(("sent", "failed")), OutboxMessage.created_at < cutoff
+    )
+    return await _delete_in_chunks(session, ids_query, chunk_size, OutboxMessage)
+
+
+async def trim_links_per_user(
+    session: AsyncSession, max_links: int = RETENTION_MAX_LINKS_PER_USER, chunk_size: int = RETENTION_CHUNK_SIZE
+) -> int:
+    """Оставляет каждому пользователю не больше max_links самых новых связей."""
+    if max_links <= 0:
+        return 0
+    overflowing = await session.execute(
+        select(MessageLink.user_id)
+        .group_by(MessageLink.user_id)
+        .having(func.count(MessageLink.id) > max_links)
+    )
+
+    total = 0
+    for user_id in overflowing.scalars().all():
+        ids_query = (
+            select(MessageLink.id)
+            .where(MessageLink.user_id == user_id)
+            .order_by(MessageLink.id.desc())
+            .offset(max_links)
+        )
+        total += await _delete_in_chunks(session, ids_query, chunk_size)
+    return total
+
+
+async def incremental_vacuum(session: AsyncSession, pages: int = RETENTION_VACUUM_PAGES):
+    """
+    Возвращает освободившиеся страницы SQLite файловой системе.
+    Работает только для баз с auto_vacuum=INCREMENTAL: при RETENTION_INCREMENTAL_VACUUM новая база
+    создается в этом режиме, существующую нужно один раз перестроить (см. config.py).
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    await session.execute(text(f"PRAGMA incremental_vacuum({int(pages)})"))
+    await session.commit()
+
+
+async def delete_old_messages(session: AsyncSession) -> dict:
+    expired = await delete_expired_links(session)
+    trimmed = await trim_links_per_user(session)
+    forwarded = await delete_expired_forwarded(session)
+    outbox = await delete_finished_outbox(session)
+    if RETENTION_INCREMENTAL_VACUUM:
+        await incremental_vacuum(session)
+    logger.info(
+        "Очистка message_links: удалено по возрасту %s, сверх лимита на пользователя %s, отметок о пересылке %s, "
+        "завершенных ответов outbox %s",
+        expired, trimmed, forwarded, outbox,
+    )
+    return {"expired": expired, "trimmed": trimmed, "forwarded": forwarded, "outbox": outbox}
+
+
+async def delete_old_messages_daily():
+    # При нескольких процессах очистку выполняет только лидер
+    if not lease_manager.is_leader:
+        return
+    try:
+        async with async_session() as session:
+            await delete_old_messages(session)
+    except Exception as e:
+        logger.error("Ошибка очистки message_links: %s", e)
+
+
+def start_scheduler():
+    scheduler = AsyncIOScheduler()
+    scheduler.add_job(delete_old_messages_daily, 'cron', day='*/3', hour=0, minute=0, second=0)
+    scheduler.start()
@@ -0,0 +1,81 @@
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+from config import ROUTING_CACHE_SIZE, ROUTING_CACHE_TTL
+
+
+class ReplyRoute(NamedTuple):
+    avito_chat_id: str
+    user_pk: int
+    avito_user_id: str
+    client_id: str
+    client_secret: str
+    telegram_chat_id: int  # Чат Telegram владельца аккаунта
+
+
+class RoutingCache:
+    """
+    LRU-кэш с TTL для маршрутизации ответов из Telegram в Avito.
+    Связи сообщений ((чат Telegram, message_id) -> чат, пользователь) и данные аккаунтов
+    (пользователь -> avito_user_id, учетные данные, чат Telegram) хранятся раздельно,
+    поэтому смена учетных данных обновляет одну запись аккаунта.
+    message_id в Telegram уникален только внутри чата, поэтому ключ связи — пара.
+    """
+
+    def __init__(self, maxsize: int = ROUTING_CACHE_SIZE, ttl: float = ROUTING_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._messages = OrderedDict()  # (telegram_chat_id, telegram_message_id) -> (avito_chat_id, user_pk, срок)
+        self._accounts = {}  # user_pk -> (avito_user_id, client_id, client_secret, telegram_chat_id)
+        self.hits = 0
+        self.misses = 0
+
+    def put_message(self, telegram_chat_id: int, telegram_message_id: int, avito_chat_id: str, user_pk: int):
+        key = (telegram_chat_id, telegram_message_id)
+        self._messages[key] = (avito_chat_id, user_pk, time.monotonic() + self.ttl)
+        self._messages.move_to_end(key)
+        while len(self._messages) > self.maxsize:
+            self._messages.popitem(last=False)
+
+    def set_account(
+        self, user_pk: int, avito_user_id: str, client_id: str, client_secret: str, telegram_chat_id: int
+    ):
+        self._accounts[user_pk] = (avito_user_id, client_id, client_secret, telegram_chat_id)
+
+    def get_account(self, user_pk: int) -> Optional[tuple]:
+        """Данные аккаунта: (avito_user_id, client_id, client_secret, telegram_chat_id) или None."""
+        return self._accounts.get(user_pk)
+
+    def get(self, telegram_chat_id: int, telegram_message_id: int) -> Optional[ReplyRoute]:
+        key = (telegram_chat_id, telegram_message_id)
+        entry = self._messages.get(key)
+        if entry is not None:
+            avito_chat_id, user_pk, expires = entry
+            account = self._accounts.get(user_pk)
+            if expires > time.monotonic() and account is not None:
+                self._messages.move_to_end(key)
+                self.hits += 1
+                return ReplyRoute(avito_chat_id, user_pk, *account)
+            if expires <= time.monotonic():
+                del self._messages[key]
+        self.misses += 1
+        return None
+
+    def invalidate_user(self, user_pk: int):
+        """Сбрасывает аккаунт; связи его сообщений станут промахами и будут удалены по TTL/LRU."""
+        self._accounts.pop(user_pk, None)
+
+    def clear(self):
+        self._messages.clear()
+        self._accounts.clear()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "messages": len(self._messages),
+            "accounts": len(self._accounts),
+        }
+
+
+routing_cache = RoutingCache()
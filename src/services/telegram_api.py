@@ -0,0 +1,42 @@
+import logging
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from src.services.rate_limiter import KeyedRateLimiter
+from config import TELEGRAM_GLOBAL_RPS, TELEGRAM_CHAT_RPS, TELEGRAM_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
+
+# Ограничения Telegram: общий поток сообщений и не чаще одного сообщения в секунду в чат
+telegram_limiter = KeyedRateLimiter(TELEGRAM_GLOBAL_RPS, TELEGRAM_CHAT_RPS, key_capacity=1)
+
+
+async def send_telegram_message(bot: Bot, chat_id: int, text: str, **kwargs):
+    """
+    Отправляет сообщение с учетом лимитов Telegram.
+    На TelegramRetryAfter ждет указанное время и повторяет отправку.
+    """
+    return await _call_limited(chat_id, bot.send_message, text=text, **kwargs)
+
+
+async def send_telegram_media(bot: Bot, chat_id: int, kind: str, media, **kwargs):
+    """
+    Отправляет фото или файл с учетом тех же лимитов.
+    media — file_id уже загруженного файла или InputFile, который можно прочитать повторно.
+    """
+    if kind == "photo":
+        return await _call_limited(chat_id, bot.send_photo, photo=media, **kwargs)
+    return await _call_limited(chat_id, bot.send_document, document=media, **kwargs)
+
+
+async def _call_limited(chat_id: int, method, **kwargs):
+    for attempt in range(TELEGRAM_MAX_RETRIES + 1):
+        await telegram_limiter.acquire(chat_id)
+        try:
+            return await method(chat_id=chat_id, **kwargs)
+        except TelegramRetryAfter as e:
+            if attempt >= TELEGRAM_MAX_RETRIES:
+                raise
+            telegram_limiter.penalize(chat_id, e.retry_after)
+            # Flood control обычно касается всего бота, поэтому придерживаем и общий поток
+            telegram_limiter.penalize(None, e.retry_after)
+            logger.warning("Telegram flood control для чата %s, повтор через %s с", chat_id, e.retry_after)
@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import delete, select
+from src.models.access_token import AccessToken
+from src.database.db import async_session
+from src.services.avito_api import request_access_token
+from src.services import metrics
+from config import TOKEN_RENEW_AHEAD, TOKEN_RENEW_CHECK
+
+logger = logging.getLogger(__name__)
+
+
+def _secret_hash(client_secret: str) -> str:
+    return hashlib.sha256((client_secret or "").encode()).hexdigest()
+
+
+class TokenEntry:
+    """Токен в памяти; срок действия отсчитывается по монотонным часам."""
+
+    __slots__ = ("client_id", "client_secret", "token", "expires", "used")
+
+    def __init__(self, client_id: str, client_secret: str, token: str, expires: float):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.token = token
+        self.expires = expires
+        self.used = True  # Запрашивался ли токен с момента последнего обновления
+
+    def remaining(self) -> float:
+        return self.expires - time.monotonic()
+
+
+class TokenManager:
+    """
+    Кэш токенов доступа Avito по аккаунтам:
+    - одновременно выполняется только одно обновление на аккаунт, остальные ждут его результат;
+    - токены обновляются в фоне до истечения;
+    - токены хранятся в базе и переживают перезапуск.
+    """
+
+    def __init__(self, renew_ahead: float = TOKEN_RENEW_AHEAD, renew_check: float = TOKEN_RENEW_CHECK):
+        self.renew_ahead = renew_ahead
+        self.renew_check = renew_check
+        self._entries = {}  # client_id -> TokenEntry
+        self._inflight = {}  # client_id -> asyncio.Task с обновлением
+        self._renew_task = None
+
+    async def get_token(self, client_id: str, client_secret: str) -> Optional[str]:
+        entry = self._entries.get(client_id)
+        if entry is not None and entry.client_secret != client_secret:
+            # Учетные данные сменились — старый токен не подходит
+            self.forget(client_id)
+            entry = None
+
+        source = "hit"
+        if entry is None:
+            entry = await self._load(client_id, client_secret)
+            source = "db"
+
+        if entry is not None and entry.remaining() > 0:
+            entry.used = True
+            metrics.TOKEN_CACHE.inc(source)
+            return entry.token
+
+        metrics.TOKEN_CACHE.inc("miss")
+        return await self.refresh(client_id, client_secret)
+
+    async def refresh(self, client_id: str, client_secret: str) -> Optional[str]:
+        """Обновляет токен; параллельные вызовы для одного аккаунта ждут один запрос."""
+        task = self._inflight.get(client_id)
+        if task is None:
+            task = asyncio.create_task(self._refresh(client_id, client_secret))
+            self._inflight[client_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(client_id, None))
+        return await asyncio.shield(task)
+
+    async def _refresh(self, client_id: str, client_secret: str) -> Optional[str]:
+        result = await request_access_token(client_id, client_secret)
+        if not result:
+            return None
+
+        token, expires_in = result.access_token, result.expires_in
+        self._entries[client_id] = TokenEntry(client_id, client_secret, token, time.monotonic() + expires_in)
+        try:
+            await self._store(client_id, client_secret, token, expires_in)
+        except Exception as e:
+            logger.error("Не удалось сохранить токен в базу: %s", e)
+        return token
+
+    async def _load(self, client_id: str, client_secret: str) -> Optional[TokenEntry]:
+        try:
+            async with async_session() as session:
+                row = await session.execute(select(AccessToken).where(AccessToken.client_id == client_id))
+                row = row.scalar_one_or_none()
+        except Exception as e:
+            logger.error("Не удалось прочитать токен из базы: %s", e)
+            return None
+
+        if row is None or row.secret_hash != _secret_hash(client_secret):
+            return None
+
+        remaining = (row.expires_at - datetime.utcnow()).total_seconds()
+        if remaining <= 0:
+            return None
+
+        entry = TokenEntry(client_id, client_secret, row.access_token, time.monotonic() + remaining)
+        self._entries[client_id] = entry
+        return entry
+
+    async def _store(self, client_id: str, client_secret: str, token: str, expires_in: float):
+        async with async_session() as session:
+            row = await session.execute(select(AccessToken).where(AccessToken.client_id == client_id))
+            row = row.scalar_one_or_none()
+            if row is None:
+                row = AccessToken(client_id=client_id)
+                session.add(row)
+            row.secret_hash = _secret_hash(client_secret)
+            row.access_token = token
+            row.expires_at = datetime.utcnow() + timedelta(seconds=expires_in)
+            await session.commit()
+
+    def forget(self, client_id: str):
+        """Убирает токен аккаунта из памяти."""
+        self._entries.pop(client_id, None)
+
+    async def check(self, client_id: str, client_secret: str) -> Optional[str]:
+        """
+        Проверяет новые учетные данные запросом токена, не трогая кэш и выключатель аккаунта:
+        пока данные не сохранены, аккаунт продолжает работать с прежними.
+        """
+        result = await request_access_token(client_id, client_secret, track=False)
+        return result.access_token if result else None
+
+    async def invalidate(self, client_id: str):
+        """Сбрасывает токен аккаунта в памяти и в базе, например при смене учетных данных."""
+        self.forget(client_id)
+        async with async_session() as session:
+            await session.execute(delete(AccessToken).where(AccessToken.client_id == client_id))
+            await session.commit()
+
+    async def _renew_loop(self):
+        while True:
+            await asyncio.sleep(self.renew_check)
+            for entry in list(self._entries.values()):
+                # Обновляем заранее только токены, которыми пользуются
+                if entry.used and entry.remaining() < self.renew_ahead and entry.client_id not in self._inflight:
+                    entry.used = False
+                    try:
+                        await self.refresh(entry.client_id, entry.client_secret)
+                    except Exception as e:
+                        logger.error("Ошибка фонового обновления токена: %s", e)
+
+    def start(self):
+        if self._renew_task is None:
+            self._renew_task = asyncio.create_task(self._renew_loop())
+
+    async def stop(self):
+        if self._renew_task is not None:
+            self._renew_task.cancel()
+            try:
+                await self._renew_task
+            except asyncio.CancelledError:
+                pass
+            self._renew_task = None
+
+
+token_manager = TokenManager()
+
+
+async def get_access_token(client_id, client_secret):
+    return await token_manager.get_token(client_id, client_secret)
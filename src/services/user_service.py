@@ -1,6 +1,11 @@
-from sqlalchemy import select
+from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.models.user import User
+from src.models.message_link import MessageLink
+from src.models.chat_cursor import ChatCursor
+from src.models.outbox_message import OutboxMessage
+from src.models.forwarded_message import ForwardedMessage
+from src.models.chat import Chat
 
 async def get_or_create_user(session: AsyncSession, telegram_id: int, client_id: str = None, client_secret: str = None) -> User:
     """
@@ -14,5 +19,26 @@ async def get_or_create_user(session: AsyncSession, telegram_id: int, client_id:
         user = User(user_id=telegram_id, client_id=client_id, client_secret=client_secret)
         session.add(user)
         await session.commit()
+    elif client_id and client_secret and (user.client_id, user.client_secret) != (client_id, client_secret):
+        # Повторная регистрация с новыми учетными данными
+        user.client_id = client_id
+        user.client_secret = client_secret
+        await session.commit()
     return user
 
+
+
+
+async def delete_user(session: AsyncSession, user: User):
+    """
+    Удаляет пользователя вместе с его связями сообщений, курсорами и данными чатов, отметками о пересылке и очередью ответов.
+    Связи удаляются явно: в старых базах внешний ключ создан без ON DELETE CASCADE.
+    """
+    await session.execute(delete(MessageLink).where(MessageLink.user_id == user.id))
+    await session.execute(delete(OutboxMessage).where(OutboxMessage.user_id == user.id))
+    await session.execute(delete(ForwardedMessage).where(ForwardedMessage.user_id == user.id))
+    if user.avito_user_id:
+        await session.execute(delete(ChatCursor).where(ChatCursor.avito_account_id == user.avito_user_id))
+        await session.execute(delete(Chat).where(Chat.avito_account_id == user.avito_user_id))
+    await session.delete(user)
+    await session.commit()
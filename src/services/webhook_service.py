@@ -0,0 +1,118 @@
+import asyncio
+import hmac
+import logging
+from typing import List, Optional
+from urllib.parse import urlsplit
+from aiohttp import web
+from sqlalchemy import select
+from src.models.user import User
+from src.database.db import async_session
+from src.services.json_codec import loads
+from config import (
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_PUBLIC_URL,
+    WEBHOOK_SECRET,
+    WEBHOOK_QUEUE_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = "/avito/webhook/{secret}"
+
+# Очередь принятых событий; разбирается в webhook_consumer
+webhook_queue: asyncio.Queue = asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+
+
+def webhook_config_errors() -> List[str]:
+    """
+    Проверяет настройки вебхука. С пустым секретом маршрут никогда не совпадет,
+    а без внешнего адреса Avito получит относительный URL.
+    """
+    errors = []
+    if not WEBHOOK_SECRET:
+        errors.append("не задан WEBHOOK_SECRET")
+    url = urlsplit(WEBHOOK_PUBLIC_URL)
+    if url.scheme not in ("http", "https") or not url.netloc:
+        errors.append("WEBHOOK_PUBLIC_URL должен быть абсолютным адресом http(s)://..., сейчас: %r" % WEBHOOK_PUBLIC_URL)
+    return errors
+
+
+def get_webhook_url() -> str:
+    """Публичный адрес вебхука, который передается Avito при подписке."""
+    return WEBHOOK_PUBLIC_URL.rstrip("/") + WEBHOOK_PATH.format(secret=WEBHOOK_SECRET)
+
+
+def parse_webhook_event(data) -> Optional[dict]:
+    """
+    Проверяет тело уведомления мессенджера Avito и возвращает
+    значение события (payload.value) или None, если событие не о новом сообщении.
+    """
+    if not isinstance(data, dict):
+        return None
+    payload = data.get("payload")
+    if not isinstance(payload, dict) or payload.get("type") != "message":
+        return None
+    value = payload.get("value")
+    if not isinstance(value, dict):
+        return None
+    if not value.get("user_id") or not value.get("chat_id"):
+        return None
+    return value
+
+
+async def handle_avito_webhook(request: web.Request) -> web.Response:
+    if not hmac.compare_digest(request.match_info.get("secret", ""), WEBHOOK_SECRET):
+        return web.Response(status=403)
+
+    try:
+        data = await request.json(loads=loads)
+    except Exception:
+        return web.Response(status=400)
+
+    event = parse_webhook_event(data)
+    if event is None:
+        # Чужие типы событий подтверждаем, чтобы Avito не повторял доставку
+        return web.json_response({"ok": True})
+
+    try:
+        webhook_queue.put_nowait(event)
+    except asyncio.QueueFull:
+        logger.warning("Очередь вебхуков переполнена, событие отклонено")
+        return web.Response(status=503)
+
+    return web.json_response({"ok": True})
+
+
+async def start_webhook_server(host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle_avito_webhook)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Сервер вебхуков Avito запущен на %s:%s", host, port)
+    return runner
+
+
+async def webhook_consumer(scheduler):
+    """
+    Разбирает очередь вебхуков. События одного аккаунта схлопываются, после чего
+    планировщик опроса (PollScheduler) опрашивает аккаунт вне очереди: так вебхук
+    и плановый опрос не обрабатывают один аккаунт одновременно.
+    """
+    while True:
+        event = await webhook_queue.get()
+        account_ids = {str(event["user_id"])}
+        while not webhook_queue.empty():
+            account_ids.add(str(webhook_queue.get_nowait()["user_id"]))
+
+        try:
+            async with async_session() as session:
+                users = await session.execute(select(User.id).where(User.avito_user_id.in_(account_ids)))
+                users = users.scalars().all()
+
+            # При шардинге планировщик знает только свои аккаунты, остальные подхватит их опрос
+            for user_pk in users:
+                scheduler.poll_now(user_pk)
+        except Exception as e:
+            logger.error("Ошибка обработки вебхуков: %s", e)
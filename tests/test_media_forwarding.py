@@ -0,0 +1,95 @@
+import os
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendPhoto
+from src.services import media_service, message_service
+from src.services.avito_models import Message
+from src.services.diagnostics import PhaseTimer
+
+
+def _photo_message() -> Message:
+    return Message(
+        id="m1",
+        author_id="42",
+        direction="in",
+        type="image",
+        created=int(time.time()),
+        content={"image": {"sizes": {"1280x960": "https://img.example/big.jpg"}}},
+        is_read=False,
+    )
+
+
+class MediaForwardingTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Telegram отклонил фото: вместо обрыва прохода аккаунта уходит ссылка на вложение;
+    отклоненный запомненный file_id забывается, и файл загружается заново.
+    """
+
+    def setUp(self):
+        handle = tempfile.NamedTemporaryFile(prefix="avito-media-test-", delete=False)
+        handle.write(b"image")
+        handle.close()
+        self.path = handle.name
+        self.forwarder = media_service.MediaForwarder()
+        rejected = TelegramBadRequest(SendPhoto(chat_id=1, photo="x"), "Bad Request: PHOTO_INVALID_DIMENSIONS")
+        self.patches = [
+            patch.object(media_service, "MEDIA_ENABLED", True),
+            patch.object(media_service, "send_telegram_media", AsyncMock(side_effect=rejected)),
+            patch.object(self.forwarder, "_lookup", AsyncMock(return_value=None)),
+            patch.object(self.forwarder, "_download", AsyncMock(return_value=(self.path, "hash", 5))),
+        ]
+        for item in self.patches:
+            item.start()
+
+    def tearDown(self):
+        for item in self.patches:
+            item.stop()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def test_forward_returns_none_when_telegram_rejects_media(self):
+        attachment = media_service.extract_attachment(_photo_message())
+        sent = await self.forwarder.forward(None, 1, attachment, "token", "7")
+        self.assertIsNone(sent)
+        self.assertFalse(os.path.exists(self.path))
+
+    async def test_forward_unread_falls_back_to_link(self):
+        send_text = AsyncMock(return_value=SimpleNamespace(message_id=100))
+        new_links, forwarded = [], []
+        with patch.object(message_service, "media_forwarder", self.forwarder), \
+                patch.object(message_service, "send_telegram_message", send_text):
+            await message_service._forward_unread(
+                None, "token", "7", 1, 1, "chat-1", None, [_photo_message()], PhaseTimer(), new_links, forwarded,
+            )
+
+        send_text.assert_awaited_once()
+        self.assertIn("https://img.example/big.jpg", send_text.await_args.args[2])
+        self.assertEqual([link["telegram_message_id"] for link in new_links], [100])
+        self.assertEqual([row["avito_message_id"] for row in forwarded], ["m1"])
+
+    async def test_rejected_file_id_is_discarded_and_file_reuploaded(self):
+        uploaded = SimpleNamespace(photo=[SimpleNamespace(file_id="new-id")])
+        rejected = TelegramBadRequest(SendPhoto(chat_id=1, photo="old-id"), "Bad Request: wrong file identifier")
+        send = AsyncMock(side_effect=[rejected, uploaded])
+        self.forwarder._lookup.side_effect = [("photo", "old-id"), None]
+        with patch.object(media_service, "send_telegram_media", send), \
+                patch.object(self.forwarder, "_discard", AsyncMock()) as discard, \
+                patch.object(self.forwarder, "_remember", AsyncMock()) as remember:
+            attachment = media_service.extract_attachment(_photo_message())
+            sent = await self.forwarder.forward(None, 1, attachment, "token", "7")
+
+        self.assertIs(sent, uploaded)
+        discard.assert_awaited_once_with("old-id")
+        self.forwarder._download.assert_awaited_once()
+        self.assertEqual(send.await_count, 2)
+        self.assertEqual(send.await_args_list[0].args[3], "old-id")
+        self.assertIsInstance(send.await_args_list[1].args[3], media_service.FSInputFile)
+        remember.assert_awaited_once_with(attachment.source_key, "hash", "photo", "new-id", 5)
+
+
+if __name__ == "__main__":
+    unittest.main()